@@ -190,93 +190,1841 @@ Rehashing - The process of increasing the array size and moving the elements to
 """
 
 
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import MutableMapping
+import functools
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
 
+def as_list(xs):
+    """
+    Batch input of the *_many methods as a list. NumPy arrays (anything with tolist) are
+    converted in one go into Python ints, which hash and compare much faster than NumPy scalars.
+    """
+    tolist = getattr(xs, "tolist", None)
+    return tolist() if tolist is not None else list(xs)
+
+
+def is_prime(n):
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+
+
+def next_prime(n):
+    """Smallest prime >= n, used to size tables (see "m is usually a prime" above)"""
+    while not is_prime(n):
+        n += 1
+    return n
+
+
+@functools.lru_cache(maxsize=None)
+def prev_prime(n):
+    """Largest prime < n, the PRIME of the double hashing h2(key) (1 when there is none)"""
+    n -= 1
+    while n > 1 and not is_prime(n):
+        n -= 1
+    return max(n, 1)
+
+
+MASK64 = 2**64 - 1
+MERSENNE_61 = 2**61 - 1  # prime, so arithmetic modulo it is a field
+
+
+def identity_hash(x):
+    return x  # integer keys are their own hash, h(key) = key % m
+
+
+class FibonacciHash:
+    """
+    Multiplicative hashing: multiply by 2^64 / golden ratio (mod 2^64) and keep the high bits,
+    which depend on all bits of the key. Strided keys (0, 8, 16, ...) that pile up in a few
+    slots with h(key) = key % m get spread out. Fast, but fixed, so not flooding-proof.
+    """
+
+    A = 0x9E3779B97F4A7C15
+
+    def __call__(self, key):
+        return ((hash(key) & MASK64) * self.A & MASK64) >> 32
+
+
+class UniversalHash:
+    """
+    Universal hashing (see above): h(key) = (a1 * hi + a2 * lo + b) mod p with p = 2^61 - 1,
+    hi and lo the two 32-bit halves of the 64-bit hash(key), and a1, a2, b drawn at random
+    when the table is created. For any two different keys the chance of a collision is
+    about 1/m whatever the keys are, so an attacker can't pick colliding keys without
+    knowing a1, a2 and b.
+
+    The key is split because a 64-bit value can be bigger than p: a * x mod p can't tell x
+    from x - p, so every negative hash (a value >= 2^63 once masked) would collide with a
+    small positive one for every a and b.
+    """
+
+    def __init__(self, seed=None):
+        rng = random.Random(seed)
+        self.a1 = rng.randrange(1, MERSENNE_61)
+        self.a2 = rng.randrange(1, MERSENNE_61)
+        self.b = rng.randrange(MERSENNE_61)
+
+    def __call__(self, key):
+        x = hash(key) & MASK64
+        return (self.a1 * (x >> 32) + self.a2 * (x & 0xFFFFFFFF) + self.b) % MERSENNE_61
+
+
+class TabulationHash:
+    """
+    Simple tabulation hashing: split the 64-bit key into 8 bytes, look every byte up in its
+    own table of random 64-bit words and xor the results. The tables are random per table
+    instance, which gives strong (3-independent) guarantees at the cost of 8 lookups.
+    """
+
+    def __init__(self, seed=None):
+        rng = random.Random(seed)
+        self.tables = [[rng.getrandbits(64) for _ in range(256)] for _ in range(8)]
+
+    def __call__(self, key):
+        x = hash(key) & MASK64
+        h = 0
+        for table in self.tables:
+            h ^= table[x & 0xFF]
+            x >>= 8
+        return h
+
+
+class PolynomialHash:
+    """
+    Weighted sum for strings from the docstring: str[0] * x^0 + str[1] * x^1 + ...,
+    computed modulo 2^61 - 1 (Horner's rule from the last character) so it stays a machine
+    sized number. Also works for bytes. Unlike hash() of str it's the same in every process.
+    """
+
+    def __init__(self, x=33):
+        self.x = x
+
+    def __call__(self, key):
+        chars = key.encode() if isinstance(key, str) else key
+        h = 0
+        for c in reversed(chars):
+            h = (h * self.x + c) % MERSENNE_61
+        return h
+
+
+class SortedBucket:
+    """
+    Chain kept sorted by hash value, used by ChainHash for buckets that got long (the
+    sorted array flavour of the self-balancing BST chains mentioned above). A lookup binary
+    searches the hash and only compares the keys with that exact hash, so it's O(log l)
+    even when many keys with different hashes land in the same bucket. Keys don't have to
+    be comparable, only their hashes are ordered.
+    """
+
+    def __init__(self, hashed_recs):
+        hashed_recs = sorted(hashed_recs, key=lambda hr: hr[0])
+        self.hashes = [h for h, _ in hashed_recs]
+        self.recs = [rec for _, rec in hashed_recs]
+
+    def index(self, h, key):
+        hashes, i = self.hashes, bisect_left(self.hashes, h)
+        while i < len(hashes) and hashes[i] == h:  # only a run of equal hashes is scanned
+            if self.recs[i][0] == key:
+                return i
+            i += 1
+        return -1
+
+    def add(self, h, rec):
+        i = bisect_right(self.hashes, h)
+        self.hashes.insert(i, h)
+        self.recs.insert(i, rec)
+
+    def pop(self, i):
+        self.hashes.pop(i)
+        return self.recs.pop(i)
+
+    def __getitem__(self, i):
+        return self.recs[i]
+
+    def __setitem__(self, i, rec):  # same key, so same hash and same position
+        self.recs[i] = rec
+
+    def __len__(self):
+        return len(self.recs)
+
+    def __iter__(self):
+        return iter(self.recs)
+
+
 class ChainHash:
-    def __init__(self, size=7):
+    def __init__(self, size=7, max_load=1.0, incremental=False, rehash_step=4, treeify_threshold=8, hash_fn=hash):
+        """
+        size is the number of buckets. Once the load factor ⍺ = count / size goes above
+        max_load, the records are rehashed into the next prime after double the number of
+        buckets, which keeps the expected chain length at most max_load.
+
+        With incremental=True the new buckets are filled lazily: every later operation moves
+        rehash_step buckets of the old array (a moved bucket is left empty), and until the
+        move is over lookups check both arrays.
+
+        A chain longer than treeify_threshold (keys that collide a lot, by bad luck, bad hashing
+        or on purpose) is turned into a SortedBucket, and back into a list once it shrinks to
+        half of that.
+
+        hash_fn maps a key to an integer, the bucket is hash_fn(key) % size. See the hash
+        functions above, e.g. UniversalHash() to make the table safe from hash flooding.
+        """
         self.size = size
         self.buckets = [[] for _ in range(size)]
+        self.count = 0  # number of records
+        self.max_load = max_load
+        self.incremental, self.rehash_step = incremental, rehash_step
+        self.treeify_threshold = treeify_threshold
+        self.hash_fn = hash_fn
+        # incremental rehash state: the array being drained and the next bucket to move from it
+        self.old_buckets, self.rehash_pos = None, 0
 
     def get_val(self, key):
-        bucket_id = hash(key) % self.size  # get hash and get bucket
-        bucket = self.buckets[bucket_id]
-        for _, rec in enumerate(bucket):
-            rec_key, rec_val = rec
-            if rec_key == key:  # record found, return val
-                return rec_val
-        else:
-            return None
+        self._rehash_some(self.rehash_step)
+        return self._get(self.hash_fn(key), key)
 
     def put_val(self, key, val):
-        bucket_id = hash(key) % self.size  # get hash and get bucket
-        bucket = self.buckets[bucket_id]
-        for i, rec in enumerate(bucket):
-            rec_key, _ = rec
-            if rec_key == key:  # record found, replace val
-                bucket[i] = (key, val)
-                return
-        bucket.append((key, val))
+        self._rehash_some(self.rehash_step)
+        self._put(self.hash_fn(key), key, val)
 
     def delete_val(self, key):
-        bucket_id = hash(key) % self.size
-        bucket = self.buckets[bucket_id]
+        self._rehash_some(self.rehash_step)
+        self._delete(self.hash_fn(key), key)
+
+    def _get(self, h, key, default=None):
+        """Value of key whose hash is h. Only reads the table."""
+        buckets, b = self._locate(h, key)  # get bucket
+        bucket = buckets[b]
+        i = self._index(bucket, h, key)
+        return bucket[i][1] if i != -1 else default
+
+    def _put(self, h, key, val):
+        """Returns True when key is new"""
+        buckets, b = self._locate(h, key)  # get bucket
+        i = self._index(buckets[b], h, key)
+        if i != -1:  # record found, replace val
+            buckets[b][i] = (key, val)
+            return False
+        self._add(buckets, b, h, (key, val))
+        self.count += 1
+        if self.count > self.max_load * self.size:
+            self._resize(next_prime(2 * self.size))
+        return True
+
+    def _delete(self, h, key):
+        """Returns True when key was there"""
+        buckets, b = self._locate(h, key)
+        bucket = buckets[b]
+        i = self._index(bucket, h, key)
+        if i == -1:
+            return False
+        bucket.pop(i)
+        self.count -= 1
+        if type(bucket) is SortedBucket and len(bucket) <= self.treeify_threshold // 2:
+            buckets[b] = bucket.recs
+        return True
+
+    def _locate(self, h, key):
+        """(array, bucket index) of the bucket holding key, or of the current bucket where it would go"""
+        if self.old_buckets is not None:
+            b = h % len(self.old_buckets)
+            if self._index(self.old_buckets[b], h, key) != -1:
+                return self.old_buckets, b
+        return self.buckets, h % self.size
+
+    def _index(self, bucket, h, key):
+        """Position of key in the bucket, -1 if it's not there"""
+        if type(bucket) is SortedBucket:
+            return bucket.index(h, key)
         for i, rec in enumerate(bucket):
-            rec_key, _ = rec
-            if rec_key == key:
-                bucket.pop(i)
+            if rec[0] == key:
+                return i
+        return -1
+
+    def _add(self, buckets, b, h, rec):
+        bucket = buckets[b]
+        if type(bucket) is SortedBucket:
+            bucket.add(h, rec)
+        else:
+            bucket.append(rec)
+            if len(bucket) > self.treeify_threshold:
+                buckets[b] = SortedBucket((self.hash_fn(r[0]), r) for r in bucket)
+
+    def reserve(self, n):
+        """Make room for n records at once and finish any pending rehash, for bulk loads"""
+        if n > self.max_load * self.size:
+            self._resize(next_prime(int(n / self.max_load) + 1))
+        if self.old_buckets is not None:
+            self._rehash_some(len(self.old_buckets))
+
+    def _resize(self, new_size):
+        if self.old_buckets is not None:  # previous rehash is still running, finish it first
+            self._rehash_some(len(self.old_buckets))
+        self.old_buckets, self.rehash_pos = self.buckets, 0
+        self.size = new_size
+        self.buckets = [[] for _ in range(new_size)]
+        if not self.incremental:
+            self._rehash_some(len(self.old_buckets))
+
+    def _rehash_some(self, n):
+        """Move the next n buckets of the old array into the current one"""
+        old = self.old_buckets
+        if old is None:
+            return
+        end = min(self.rehash_pos + n, len(old))
+        size, buckets = self.size, self.buckets
+        for j in range(self.rehash_pos, end):
+            for rec in old[j]:
+                h = self.hash_fn(rec[0])
+                self._add(buckets, h % size, h, rec)
+            old[j] = []
+        self.rehash_pos = end
+        if end == len(old):  # done, drop the old array
+            self.old_buckets, self.rehash_pos = None, 0
+
+    def put_many(self, keys, vals):
+        """
+        Batch version of put_val for parallel sequences (or NumPy arrays) of keys and values.
+        The table is sized for the whole batch and the hashes are computed for all keys first,
+        so the loop only scans the chains.
+        """
+        keys = as_list(keys)
+        self.reserve(self.count + len(keys))
+        size, buckets, index = self.size, self.buckets, self._index
+        for key, val, h in zip(keys, as_list(vals), map(self.hash_fn, keys)):
+            b = h % size
+            i = index(buckets[b], h, key)
+            if i != -1:
+                buckets[b][i] = (key, val)
+            else:
+                self._add(buckets, b, h, (key, val))
+                self.count += 1
+
+    def get_many(self, keys, default=None):
+        """
+        Values of a batch of keys, default for the missing ones. A pending rehash only moves
+        rehash_step buckets, like for get_val: the lookups check both arrays through _locate.
+        """
+        keys = as_list(keys)
+        self._rehash_some(self.rehash_step)
+        get = self._get
+        return [get(h, key, default) for key, h in zip(keys, map(self.hash_fn, keys))]
+
+    def contains_many(self, keys):
+        keys = as_list(keys)
+        self._rehash_some(self.rehash_step)
+        locate, index = self._locate, self._index
+        res = []
+        for key, h in zip(keys, map(self.hash_fn, keys)):
+            buckets, b = locate(h, key)
+            res.append(index(buckets[b], h, key) != -1)
+        return res
+
+
+class ConcurrentChainHash:
+    """
+    Thread-safe map built from stripes: the hash picks one of n_stripes ChainHash segments,
+    and each segment has its own lock (lock striping). Writers only wait for writers of
+    the same segment, so n_stripes writers can run at once on a free-threaded build.
+    The segments rehash incrementally, so a resize holds a segment lock only for a
+    rehash_step sized piece of work.
+
+    Reads take no lock. Every segment has a version that a writer bumps to odd before it
+    changes anything and back to even after (a seqlock). A reader notes the version, reads
+    the segment and accepts the result only if the version was even and hasn't changed;
+    otherwise the read overlapped a write, and it tries again. After a few failed attempts it
+    takes the lock, so a reader can't starve. A torn read can't return a wrong value, at
+    worst it raises or misses, and the version check throws that result away.
+    """
+
+    READ_ATTEMPTS = 4
+
+    def __init__(self, n_stripes=16, hash_fn=hash, **kwargs):
+        """kwargs are passed on to every ChainHash segment"""
+        kwargs.setdefault("incremental", True)
+        self.hash_fn = hash_fn
+        self.segments = [ChainHash(hash_fn=hash_fn, **kwargs) for _ in range(n_stripes)]
+        self.locks = [threading.Lock() for _ in range(n_stripes)]
+        self.versions = [0] * n_stripes
+
+    def get_val(self, key, default=None):
+        h = self.hash_fn(key)
+        s = h % len(self.segments)
+        segment, versions = self.segments[s], self.versions
+        for _ in range(self.READ_ATTEMPTS):
+            v = versions[s]
+            if v % 2 == 0:  # no write in progress
+                try:
+                    val = segment._get(h, key, default)
+                except Exception:  # torn read, the version has changed
+                    continue
+                if versions[s] == v:
+                    return val
+        with self.locks[s]:
+            return segment._get(h, key, default)
+
+    def put_val(self, key, val):
+        return self._write(ChainHash._put, key, val)
+
+    def delete_val(self, key):
+        return self._write(ChainHash._delete, key)
+
+    def _write(self, op, key, *args):
+        h = self.hash_fn(key)
+        s = h % len(self.segments)
+        segment = self.segments[s]
+        with self.locks[s]:
+            self.versions[s] += 1  # odd: readers will retry
+            try:
+                segment._rehash_some(segment.rehash_step)
+                return op(segment, h, key, *args)
+            finally:
+                self.versions[s] += 1
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments)
+
+
+class CacheNode:
+    """Cache entry that is also its own node in a doubly linked list (intrusive list)"""
+
+    def __init__(self, key=None, val=None, nbytes=0, expires=None):
+        self.key, self.val = key, val
+        self.nbytes = nbytes
+        self.expires = expires  # clock time after which the entry is stale, None for never
+        self.freq = 1  # number of accesses, for LFU
+        self.prev = self.next = self
+
+
+class DList:
+    """
+    Circular doubly linked list with a sentinel node: push_front, last and remove are O(1)
+    and need no None checks. insert_begin of linked-lists/doubly-linked-list.py is O(1) too
+    but has to check for an empty list, and delete_last has to walk to the end.
+    """
+
+    def __init__(self):
+        self.head = CacheNode()  # sentinel, head.next is the first node and head.prev the last
+
+    def push_front(self, node):
+        node.prev, node.next = self.head, self.head.next
+        self.head.next.prev = node
+        self.head.next = node
+
+    def remove(self, node):
+        node.prev.next, node.next.prev = node.next, node.prev
+
+    def last(self):
+        return self.head.prev if self.head.prev is not self.head else None
+
+    def __bool__(self):
+        return self.head.next is not self.head
+
+
+_MISSING = object()
+
+
+class Cache:
+    def __init__(self, capacity=None, max_bytes=None, policy="lru", ttl=None, sizeof=None, clock=time.monotonic):
+        """
+        Bounded cache: a ChainHash from keys to nodes plus doubly linked lists of the same
+        nodes in eviction order, so get and put are O(1).
+
+        policy picks the entry to evict once there are more than capacity entries, or their
+        sizes add up to more than max_bytes:
+            - "lru": least recently used. Every hit moves the node to the front of the list
+              and the last node is evicted.
+            - "lfu": least frequently used, the least recently used among those on a tie.
+              There is one list per access count and the lowest count is tracked, so a hit
+              moves the node to the list of the next count, still O(1).
+            - "ttl": the oldest entry, i.e. the one that expires first.
+        With ttl (seconds), entries expire ttl after they were put, whatever the policy.
+
+        sizeof(key, val) gives the size of an entry for max_bytes, sys.getsizeof of both by default.
+        hits, misses, evictions and expirations count what happened so far.
+        """
+        if policy not in ("lru", "lfu", "ttl"):
+            raise ValueError("policy must be 'lru', 'lfu' or 'ttl'")
+        if policy == "ttl" and ttl is None:
+            raise ValueError("the ttl policy needs a ttl")
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity, self.max_bytes = capacity, max_bytes
+        self.policy, self.ttl = policy, ttl
+        self.sizeof = sizeof or (lambda key, val: sys.getsizeof(key) + sys.getsizeof(val))
+        self.clock = clock
+        self.index = ChainHash()
+        self.order = DList()  # lru and ttl: most recent first
+        self.freq_lists, self.min_freq = {}, 1  # lfu: access count -> DList
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        node = self.index.get_val(key)
+        if node is not None and node.expires is not None and node.expires <= self.clock():
+            self._remove(node)
+            self.expirations += 1
+            node = None
+        if node is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._touch(node)
+        return node.val
+
+    def put(self, key, val):
+        nbytes = self.sizeof(key, val) if self.max_bytes is not None else 0
+        node = self.index.get_val(key)
+        freq = 1
+        if node is not None:  # replacing keeps the access count
+            freq = node.freq
+            self._remove(node)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return  # would evict everything and still not fit
+        self._evict(1, nbytes)  # make room first, the new entry must not be its own victim
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        node = CacheNode(key, val, nbytes, expires)
+        node.freq = freq
+        self.index.put_val(key, node)
+        self.nbytes += nbytes
+        if self.policy == "lfu":
+            self._freq_list(freq).push_front(node)
+            self.min_freq = min(self.min_freq, freq)
+        else:
+            self.order.push_front(node)
+
+    def delete(self, key):
+        node = self.index.get_val(key)
+        if node is not None:
+            self._remove(node)
+
+    def memoize(self, fn):
+        """Decorator caching fn's results by its (hashable) positional arguments"""
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            res = self.get(args, _MISSING)
+            if res is _MISSING:
+                res = fn(*args)
+                self.put(args, res)
+            return res
+
+        return wrapper
+
+    def __len__(self):
+        return self.index.count
+
+    def _touch(self, node):
+        if self.policy == "lru":
+            self.order.remove(node)
+            self.order.push_front(node)
+        elif self.policy == "lfu":
+            freq_list = self.freq_lists[node.freq]
+            freq_list.remove(node)
+            if not freq_list:
+                del self.freq_lists[node.freq]
+                if self.min_freq == node.freq:
+                    self.min_freq += 1
+            node.freq += 1
+            self._freq_list(node.freq).push_front(node)
+
+    def _freq_list(self, freq):
+        if freq not in self.freq_lists:
+            self.freq_lists[freq] = DList()
+        return self.freq_lists[freq]
+
+    def _remove(self, node):
+        if self.policy == "lfu":
+            freq_list = self.freq_lists[node.freq]
+            freq_list.remove(node)
+            if not freq_list:
+                del self.freq_lists[node.freq]
+        else:
+            self.order.remove(node)
+        self.index.delete_val(node.key)
+        self.nbytes -= node.nbytes
+
+    def _victim(self):
+        if self.policy != "lfu":
+            return self.order.last()
+        if not self.freq_lists:
+            return None
+        # a delete or an expiry can empty the list of min_freq, then move on to the next count
+        while self.min_freq not in self.freq_lists:
+            self.min_freq += 1
+        return self.freq_lists[self.min_freq].last()
+
+    def _evict(self, count, nbytes):
+        """Evict until count more entries of nbytes more bytes fit"""
+        if self.policy == "ttl":  # the oldest entries expire first, drop the stale ones
+            now = self.clock()
+            while (node := self.order.last()) is not None and node.expires <= now:
+                self._remove(node)
+                self.expirations += 1
+        while (self.capacity is not None and len(self) + count > self.capacity) or (
+            self.max_bytes is not None and self.nbytes + nbytes > self.max_bytes
+        ):
+            node = self._victim()
+            if node is None:  # nothing left to evict
                 break
+            self._remove(node)
+            self.evictions += 1
 
 
-class OpenAddressHash:
-    def __init__(self, cap):
+class HashRing:
+    """
+    Consistent hashing: every node is put at vnodes pseudo-random points of a circle of hash
+    values, and a key belongs to the first node point at or after its own hash (wrapping
+    around). Adding or removing a node only moves the keys on the arcs next to its points,
+    about 1/n of them, instead of almost every key like hash % n does when n changes.
+    The virtual nodes even out the arc lengths.
+    """
+
+    def __init__(self, hash_fn, vnodes=64):
+        self.hash_fn, self.vnodes = hash_fn, vnodes
+        self.points, self.owners = [], []  # sorted points on the circle and the node of each
+
+    def add(self, node):
+        for v in range(self.vnodes):
+            p = self.hash_fn((node, v))
+            i = bisect_left(self.points, p)
+            self.points.insert(i, p)
+            self.owners.insert(i, node)
+
+    def remove(self, node):
+        keep = [i for i, owner in enumerate(self.owners) if owner != node]
+        self.points = [self.points[i] for i in keep]
+        self.owners = [self.owners[i] for i in keep]
+
+    def owner(self, h):
+        return self.owners[bisect_left(self.points, h) % len(self.points)]
+
+
+def shard_worker(conn, chain_kwargs, ring_hash):
+    """
+    Loop of a ShardedHash worker process: one ChainHash, answering batches sent over conn.
+    ring_hash is the hash that places keys on the ring, used to find the keys leaving the shard.
+    """
+    shard = ChainHash(**chain_kwargs)
+    while True:
+        op, keys, vals = conn.recv()
+        if op == "put":
+            shard.put_many(keys, vals)
+            conn.send(None)
+        elif op == "get":
+            conn.send(shard.get_many(keys))
+        elif op == "pop":  # remove and return the values
+            res = shard.get_many(keys)
+            for key in keys:
+                shard.delete_val(key)
+            conn.send(res)
+        elif op == "split":  # keys holds ring arcs (lo, hi]: remove and return the records on them
+            arcs = sorted(keys, key=lambda arc: arc[1])
+            his = [hi for _, hi in arcs]
+            shard.reserve(0)  # finish any rehash, then every record is in buckets
+            leaving = []
+            for bucket in shard.buckets:
+                for rec in bucket:
+                    h = ring_hash(rec[0])
+                    i = bisect_left(his, h)
+                    if i < len(arcs) and arcs[i][0] < h:
+                        leaving.append(rec)
+            for key, _ in leaving:
+                shard.delete_val(key)
+            conn.send(([key for key, _ in leaving], [val for _, val in leaving]))
+        elif op == "len":
+            conn.send(shard.count)
+        else:  # stop
+            conn.close()
+            return
+
+
+class ShardedHash:
+    def __init__(self, n_shards=4, vnodes=64, hash_fn=None, mp_context=None, **chain_kwargs):
+        """
+        Map split into n_shards worker processes, each holding one ChainHash (created with
+        chain_kwargs), so the data can use the memory and the cores of the whole box.
+        A HashRing routes every key to its shard.
+
+        The *_many methods are pipelined: the batch is split by shard, every shard gets its part
+        before any answer is read, so all the shards work on it at the same time.
+
+        hash_fn places the keys on the ring. It also runs in the workers, to find the keys
+        leaving a shard on resize, so it must give the same results in every process: that's
+        why the workers are forked by default, they inherit the seed of hash() with the rest
+        of the memory (and the module needn't be importable by name, it isn't with a dash).
+        """
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+        self.hash_fn = hash_fn or UniversalHash()
+        if mp_context is None:
+            fork = "fork" in multiprocessing.get_all_start_methods()
+            mp_context = multiprocessing.get_context("fork" if fork else None)
+        self.mp_context, self.chain_kwargs = mp_context, chain_kwargs
+        self.ring = HashRing(self.hash_fn, vnodes)
+        self.shards = {}  # shard id -> (process, connection)
+        self.next_id = 0
+        for _ in range(n_shards):
+            self._start_shard()
+
+    def put_val(self, key, val):
+        self.put_many([key], [val])
+
+    def get_val(self, key):
+        return self.get_many([key])[0]
+
+    def delete_val(self, key):
+        self._scatter("pop", [key])
+
+    def put_many(self, keys, vals):
+        self._scatter("put", as_list(keys), as_list(vals))
+
+    def get_many(self, keys):
+        return self._scatter("get", as_list(keys))
+
+    def __len__(self):
+        for _, conn in self.shards.values():
+            conn.send(("len", None, None))
+        return sum(conn.recv() for _, conn in self.shards.values())
+
+    def resize(self, n_shards):
+        """
+        Add or remove shards. Thanks to the ring only the keys whose owner changed are
+        moved, returns how many that were.
+
+        A new shard takes over the arcs that end at its points. Those arcs are sent to the
+        shards that owned them, which hash their own keys (in parallel) and send back only
+        the records on the arcs. A removed shard sends back all its records.
+        """
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+        moved = 0
+        while len(self.shards) < n_shards:
+            had_shards = bool(self.shards)
+            new = self._start_shard()
+            if had_shards:
+                arcs = self._arcs(new)
+                for shard_id in arcs:
+                    self.shards[shard_id][1].send(("split", arcs[shard_id], None))
+                for shard_id in arcs:
+                    moved += self._put_moved(self.shards[shard_id][1].recv())
+        while len(self.shards) > n_shards:
+            old = next(iter(self.shards))
+            self.ring.remove(old)
+            moved += self._put_moved(self._send(old, "split", [(-math.inf, math.inf)]))
+            self._stop_shard(old)
+        return moved
+
+    def close(self):
+        for shard_id in list(self.shards):
+            self._stop_shard(shard_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_shard(self):
+        shard_id, self.next_id = self.next_id, self.next_id + 1
+        conn, worker_conn = self.mp_context.Pipe()
+        args = (worker_conn, self.chain_kwargs, self.hash_fn)
+        proc = self.mp_context.Process(target=shard_worker, args=args, daemon=True)
+        proc.start()
+        worker_conn.close()
+        self.shards[shard_id] = (proc, conn)
+        self.ring.add(shard_id)
+        return shard_id
+
+    def _stop_shard(self, shard_id):
+        proc, conn = self.shards.pop(shard_id)
+        conn.send(("stop", None, None))
+        proc.join()
+        conn.close()
+
+    def _arcs(self, node):
+        """
+        Arcs (lo, hi] of the ring owned by node, grouped by the shard that owned them before
+        it was added: the owner of the next point that isn't node's.
+        """
+        points, owners = self.ring.points, self.ring.owners
+        n = len(points)
+        arcs = {}
+        for i in range(n):
+            if owners[i] != node:
+                continue
+            j = (i + 1) % n
+            while owners[j] == node:
+                j = (j + 1) % n
+            if i == 0:  # the arc wraps around the top of the circle
+                parts = [(points[-1], math.inf), (-math.inf, points[0])]
+            else:
+                parts = [(points[i - 1], points[i])]
+            arcs.setdefault(owners[j], []).extend(parts)
+        return arcs
+
+    def _put_moved(self, records):
+        keys, vals = records
+        if keys:
+            self.put_many(keys, vals)
+        return len(keys)
+
+    def _send(self, shard_id, op, keys, vals=None):
+        conn = self.shards[shard_id][1]
+        conn.send((op, keys, vals))
+        return conn.recv()
+
+    def _scatter(self, op, keys, vals=None):
+        """Run op on a batch: split it by shard, send every part, then collect the answers in order"""
+        owner, hash_fn = self.ring.owner, self.hash_fn
+        parts = {}  # shard id -> positions in the batch
+        for i, key in enumerate(keys):
+            parts.setdefault(owner(hash_fn(key)), []).append(i)
+        for shard_id, idx in parts.items():
+            part_vals = [vals[i] for i in idx] if vals is not None else None
+            self.shards[shard_id][1].send((op, [keys[i] for i in idx], part_vals))
+        res = [None] * len(keys)
+        for shard_id, idx in parts.items():
+            answer = self.shards[shard_id][1].recv()
+            if answer is not None:
+                for i, val in zip(idx, answer):
+                    res[i] = val
+        return res
+
+
+def mix64(h):
+    """splitmix64 finalizer: every bit of h affects every bit of the result"""
+    h &= MASK64
+    h = (h ^ (h >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    h = (h ^ (h >> 27)) * 0x94D049BB133111EB & MASK64
+    return h ^ (h >> 31)
+
+
+class BloomFilter:
+    """
+    Bloom filter over key hashes: k bit positions per key in an array of m bits. If any of the
+    k bits of a key is 0 the key was never added; if they're all 1 it probably was. For n keys
+    and a target false-positive rate p, m = -n ln(p) / ln(2)^2 and k = m/n ln(2) are optimal
+    (about 9.6 bits per key for p = 1%).
+
+    The k positions come from one 64-bit hash with double hashing, h1 + i * h2, so a lookup
+    costs a single mix of the key hash. Bits can't be cleared since other keys may share
+    them: discard only counts the removed key as stale, and the owner rebuilds the filter
+    when too many are.
+    """
+
+    def __init__(self, n, fp_rate=0.01):
+        self.m = max(8, math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / n * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0  # keys added, stale ones included since their bits are still set
+        self.stale = 0
+
+    def _positions(self, h):
+        h = mix64(h)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def add(self, h):
+        bits = self.bits
+        for p in self._positions(h):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return True
+
+    def discard(self, h):
+        self.stale += 1
+
+    def might_contain(self, h):
+        bits = self.bits
+        return all(bits[p >> 3] >> (p & 7) & 1 for p in self._positions(h))
+
+    def expected_fp_rate(self):
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+
+class CuckooFilter:
+    """
+    Cuckoo filter over key hashes: a 16-bit fingerprint of every key is stored in one of two
+    buckets of bucket_size slots, i1 = h % buckets and i2 = i1 ^ mix(fingerprint). i2 only
+    needs the fingerprint, so a fingerprint can be kicked out to its other bucket without
+    knowing its key, like cuckoo hashing does. Lookups check at most 2 buckets and, unlike a
+    Bloom filter, a key can be removed by deleting its fingerprint.
+
+    A false positive needs another key with the same fingerprint in one of the 2 buckets,
+    which happens with probability about 2 * bucket_size / 2^16 at full load.
+    add returns False when no slot was found after max_kicks evictions. A fingerprint has
+    been dropped then, so the filter can no longer be trusted.
+    """
+
+    FP_BITS = 16
+
+    def __init__(self, n, bucket_size=4, max_kicks=500):
+        buckets = 1  # a power of 2, so that i1 ^ x stays in range and i2 ^ x gives back i1
+        while buckets * bucket_size * 0.95 < n:
+            buckets *= 2
+        self.buckets, self.bucket_size, self.max_kicks = buckets, bucket_size, max_kicks
+        self.slots = array("H", bytes(2 * buckets * bucket_size))  # 0 is an empty slot
+        self.count = 0
+        self.stale = 0  # never anything stale, removes are exact
+        self.rng = random.Random(0)
+
+    def _index_fp(self, h):
+        h = mix64(h)
+        return h & (self.buckets - 1), (h >> 32) % 0xFFFF + 1  # fingerprint in 1..2^16 - 1
+
+    def _alt(self, i, fp):
+        return (i ^ mix64(fp)) & (self.buckets - 1)
+
+    def _bucket(self, i):
+        return range(i * self.bucket_size, (i + 1) * self.bucket_size)
+
+    def _put(self, i, fp):
+        slots = self.slots
+        for j in self._bucket(i):
+            if slots[j] == 0:
+                slots[j] = fp
+                return True
+        return False
+
+    def add(self, h):
+        i, fp = self._index_fp(h)
+        self.count += 1
+        if self._put(i, fp) or self._put(self._alt(i, fp), fp):
+            return True
+        if self.rng.random() < 0.5:
+            i = self._alt(i, fp)
+        slots = self.slots
+        for _ in range(self.max_kicks):
+            j = i * self.bucket_size + self.rng.randrange(self.bucket_size)
+            fp, slots[j] = slots[j], fp  # kick out a resident and move it to its other bucket
+            i = self._alt(i, fp)
+            if self._put(i, fp):
+                return True
+        return False
+
+    def discard(self, h):
+        i, fp = self._index_fp(h)
+        slots = self.slots
+        for b in (i, self._alt(i, fp)):
+            for j in self._bucket(b):
+                if slots[j] == fp:
+                    slots[j] = 0
+                    self.count -= 1
+                    return
+
+    def might_contain(self, h):
+        i, fp = self._index_fp(h)
+        slots, bs = self.slots, self.bucket_size
+        a, b = i * bs, self._alt(i, fp) * bs
+        return fp in slots[a : a + bs] or fp in slots[b : b + bs]
+
+    def expected_fp_rate(self):
+        load = self.count / len(self.slots)
+        return 1 - (1 - 1 / 0xFFFF) ** (2 * self.bucket_size * load)
+
+
+class PerfectHash:
+    """
+    Minimal perfect hash table for a static key set (see "if we know keys in advance, we can
+    design a perfect hashing function" above), built BBHash style: n keys get n slots and no
+    two keys share one, so a lookup probes exactly one slot.
+
+    The keys are hashed into a bit array of gamma * n bits. A key that lands alone on its
+    position sets the bit; the colliding ones move on to the next level, a smaller bit array
+    with an independent hash, and so on. The slot of a key is the rank of its bit, i.e. the
+    number of set bits before it over all the levels. With gamma = 1 about 63% of the keys
+    settle at each level, which adds up to e ~ 2.72 bits per key. A popcount stored every 512
+    bits saves counting from the start on a rank, for about 3 bits per key in total
+    (bits_per_key). The few keys still colliding after max_levels go into a small dict.
+
+    Keys can be ints, str or bytes. Their hashes depend on the seed but not on the process
+    (hash() of a str does), so a table written by save() works wherever load() reads it.
+    Ints that fit in a signed 64-bit word never collide; bigger ones are hashed from their
+    bytes, like str, and may (rarely, differently for every seed).
+    """
+
+    MAGIC = b"MPHASH02"  # 02: ints beyond 64 bits are hashed from their bytes
+    HEADER = struct.Struct("<8s4q")  # magic, number of keys, seed, levels, fallback keys
+    BLOCK = 8  # 64-bit words per stored popcount
+
+    def __init__(self, keys, values=None, gamma=1.0, seed=0, max_levels=32):
+        """
+        Build the table for keys (any iterable), values[i] being the value of keys[i].
+        Raises ValueError for duplicate keys. gamma > 1 trades space for a faster build
+        and fewer levels to check on a lookup.
+        """
+        keys = as_list(keys)
+        values = [None] * len(keys) if values is None else as_list(values)
+        if len(values) != len(keys):
+            raise ValueError("keys and values must have the same length")
+        self._seed(seed)
+        hashes = [self._key_hash(x) for x in keys]
+        if len(set(hashes)) != len(hashes):
+            raise ValueError("duplicate keys (or a rare hash collision, try another seed)")
+        sizes, set_bits = [], []
+        remaining = hashes
+        while remaining and len(sizes) < max_levels:
+            level = len(sizes)
+            size = 64 * max(1, math.ceil(gamma * len(remaining) / 64))  # whole words per level
+            hits = bytearray(size)
+            positions = [self._level_hash(h, level) % size for h in remaining]
+            for p in positions:
+                if hits[p] < 2:
+                    hits[p] += 1
+            sizes.append(size)
+            set_bits.append([p for p, c in enumerate(hits) if c == 1])
+            remaining = [h for h, p in zip(remaining, positions) if hits[p] > 1]
+        self.sizes = sizes
+        self.words = array("Q", bytes(sum(sizes) // 8))
+        offset = 0
+        for size, bits in zip(sizes, set_bits):
+            for p in bits:
+                g = offset + p
+                self.words[g >> 6] |= 1 << (g & 63)
+            offset += size
+        self._index_levels()
+        # slots after the ranked ones go to the keys that never got a bit to themselves
+        ranked = len(keys) - len(remaining)
+        self.fallback = {h: ranked + i for i, h in enumerate(remaining)}
+        self.keys, self.values = [None] * len(keys), [None] * len(keys)
+        for x, h, v in zip(keys, hashes, values):
+            i = self._index(h)
+            self.keys[i], self.values[i] = x, v
+
+    def index(self, key):
+        """Slot of key, in 0..n-1, and -1 if key isn't one of the keys of the table"""
+        i = self._index(self._key_hash(key))
+        return i if i != -1 and self.keys[i] == key else -1
+
+    def get_val(self, key, default=None):
+        i = self.index(key)
+        return self.values[i] if i != -1 else default
+
+    def __contains__(self, key):
+        return self.index(key) != -1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bits_per_key(self):
+        """Size of the hash function itself (bit arrays, popcounts, leftover keys) per key"""
+        bits = 64 * (len(self.words) + len(self.ranks)) + 128 * len(self.fallback)
+        return bits / max(1, len(self.keys))
+
+    def save(self, path):
+        """
+        Write the table to path: header, level sizes, bit arrays and leftover keys as raw
+        64-bit words, then the keys and values pickled. The popcounts are rebuilt on load.
+        """
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(self.keys), self.seed, len(self.sizes), len(self.fallback)))
+            f.write(array("q", self.sizes).tobytes())
+            f.write(self.words.tobytes())
+            f.write(array("Q", self.fallback).tobytes())
+            f.write(array("q", self.fallback.values()).tobytes())
+            pickle.dump((self.keys, self.values), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, n, seed, n_levels, n_fallback = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError(f"{path} is not a PerfectHash file")
+        pos = cls.HEADER.size
+
+        def read(typecode, count):
+            nonlocal pos
+            xs = array(typecode, data[pos : pos + 8 * count])
+            pos += 8 * count
+            return xs
+
+        self = cls.__new__(cls)
+        self._seed(seed)
+        self.sizes = list(read("q", n_levels))
+        self.words = read("Q", sum(self.sizes) // 64)
+        self._index_levels()
+        self.fallback = dict(zip(read("Q", n_fallback), read("q", n_fallback)))
+        self.keys, self.values = pickle.loads(data[pos:])
+        return self
+
+    def _seed(self, seed):
+        self.seed = seed
+        rng = random.Random(seed)
+        self.salt = rng.getrandbits(64)
+        self.poly = PolynomialHash(rng.randrange(2, MERSENNE_61))
+        self.big_salt = rng.getrandbits(64)
+
+    def _key_hash(self, key):
+        if isinstance(key, int):
+            if -(2**63) <= key < 2**63:
+                return mix64(key ^ self.salt)  # a bijection on 64-bit values, so no collisions
+            # masking to 64 bits would map key and key + 2^64 together whatever the seed
+            data = key.to_bytes((key.bit_length() + 8) // 8, "little", signed=True)
+            return mix64(self.poly(data) ^ self.big_salt)
+        if isinstance(key, (str, bytes)):
+            return mix64(self.poly(key) ^ self.salt)
+        raise TypeError("PerfectHash keys must be int, str or bytes")
+
+    def _level_hash(self, h, level):
+        return mix64(h + (level + 1) * FibonacciHash.A)
+
+    def _index_levels(self):
+        """Bit offset of every level and the popcount of the words before every block"""
+        self.offsets = [0]
+        for size in self.sizes:
+            self.offsets.append(self.offsets[-1] + size)
+        self.ranks = array("Q")
+        total = 0
+        for w in range(0, len(self.words), self.BLOCK):
+            self.ranks.append(total)
+            total += sum(x.bit_count() for x in self.words[w : w + self.BLOCK])
+
+    def _index(self, h):
+        words = self.words
+        for level, size in enumerate(self.sizes):
+            g = self.offsets[level] + self._level_hash(h, level) % size
+            if words[g >> 6] >> (g & 63) & 1:
+                return self._rank(g)
+        return self.fallback.get(h, -1)
+
+    def _rank(self, g):
+        """Number of set bits before bit g"""
+        w = g >> 6
+        block = w // self.BLOCK
+        r = self.ranks[block]
+        for x in self.words[block * self.BLOCK : w]:
+            r += x.bit_count()
+        return r + (self.words[w] & ((1 << (g & 63)) - 1)).bit_count()
+
+
+EMPTY, LIVE, DELETED = 0, 1, 2  # slot states used by OpenAddressHash
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+
+
+class Slots:
+    """
+    One array of an open addressing table: the keys, and separately the state of each slot.
+    Keeping the state apart means no key value has to be reserved as an "empty" or "deleted" marker.
+    """
+
+    def __init__(self, cap, keys, states=None):
         self.cap = cap
-        self.buckets = [-1] * cap  # all slots initialized to -1
-        self.size = 0 . # to keep track of number of elements in the array
+        self.keys = keys
+        self.states = bytearray(cap) if states is None else states  # all slots start EMPTY
+        self.filter = None  # BloomFilter or CuckooFilter of the key hashes, if the table uses one
+
 
-    def hash(self, x):
-        return x % self.cap  # simple hash function
+class OpenAddressHash:
+    def __init__(
+        self,
+        cap,
+        max_load=0.7,
+        min_load=0.2,
+        rehash_step=8,
+        deletion=None,
+        max_tombstones=0.2,
+        probe="linear",
+        hash_fn=identity_hash,
+        prefilter=None,
+        prefilter_fp_rate=0.01,
+    ):
+        """
+        The table grows to the next prime after double its capacity once the load factor
+        goes above max_load, and shrinks to half once it drops below min_load (but never
+        below the initial capacity).
+
+        Rehashing is incremental. The bigger (or smaller) array is allocated right away but the
+        keys are moved lazily: every later operation moves rehash_step slots of the old array.
+        So no single insert pays for copying the whole table. Until the move is over, a key can
+        live in either array and lookups check both. Slots of the old array below rehash_pos
+        have already been copied and are ignored, which keeps the old array untouched and its
+        probe chains intact.
+
+        probe picks the probe sequence (see the module docstring):
+            - "linear": h(key) + i
+            - "quadratic": h(key) + i^2. Needs max_load <= 0.5 (the capacity is kept prime).
+            - "double": h1(key) + i * h2(key) where h2(key) = PRIME - key % PRIME and PRIME is the
+              largest prime below the (prime) capacity.
+            - "robin_hood": linear probing, but an insert that has travelled further from its home
+              slot than the key sitting in the slot takes that slot and carries on with the evicted
+              key instead ("take from the rich"). This evens out the probe lengths and lets a search
+              stop as soon as it meets a key closer to its home than the searched key would be.
+
+        deletion picks how remove frees a slot (defaults to "backward_shift" for robin_hood and
+        to "tombstone" otherwise):
+            - "tombstone": mark the slot DELETED. Searches walk over tombstones, so once more than
+              max_tombstones of the slots are tombstones the table is rehashed into an array of the
+              same size, which drops them (compaction).
+            - "backward_shift": empty the slot and move the following keys of the cluster one step
+              back towards their home slot, so no tombstone is ever left behind. Only works for
+              linear and robin_hood probing.
+
+        hash_fn maps a key to an integer, the home slot is hash_fn(key) % cap. The default keeps
+        h(key) = key; pass one of the hash functions above for keys that cluster or can't be trusted.
+
+        prefilter puts a small probabilistic filter of the keys in front of every array, so a
+        lookup of an absent key is usually answered without probing (a miss costs 1/(1 - ⍺)
+        probes, see above, against one filter check):
+            - "bloom": BloomFilter sized for prefilter_fp_rate at max_load. Removed keys stay
+              in it, so the table is compacted once more than max_tombstones of the slots
+              are stale keys, which builds a fresh filter.
+            - "cuckoo": CuckooFilter, which removes keys exactly (about 0.01% false positives).
+        Each array gets its own filter, built along with it, so an incremental rehash fills the
+        new filter as it moves the keys. filter_stats() reports the false-positive rate.
+        """
+        if probe not in ("linear", "quadratic", "double", "robin_hood"):
+            raise ValueError("probe must be 'linear', 'quadratic', 'double' or 'robin_hood'")
+        if deletion is None:
+            deletion = "backward_shift" if probe == "robin_hood" else "tombstone"
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be between 0 and 1")
+        if not 0 <= min_load < max_load / 2:  # otherwise a shrink could trigger a grow right away
+            raise ValueError("min_load must be less than half of max_load")
+        if deletion not in ("tombstone", "backward_shift"):
+            raise ValueError("deletion must be 'tombstone' or 'backward_shift'")
+        if deletion == "backward_shift" and probe not in ("linear", "robin_hood"):
+            raise ValueError("backward_shift deletion needs linear or robin_hood probing")
+        if deletion == "tombstone" and probe == "robin_hood":
+            raise ValueError("robin_hood probing needs backward_shift deletion")
+        if probe == "quadratic" and max_load > 0.5:
+            raise ValueError("quadratic probing needs max_load <= 0.5")
+        if not 0 < max_tombstones < 1 - max_load:  # leave some empty slots for searches to stop at
+            raise ValueError("max_tombstones must be between 0 and 1 - max_load")
+        if prefilter not in (None, "bloom", "cuckoo"):
+            raise ValueError("prefilter must be None, 'bloom' or 'cuckoo'")
+        if probe in ("quadratic", "double"):
+            cap = next_prime(cap)  # both need a prime capacity to reach the free slots
+        self.max_load, self.min_load = max_load, min_load
+        self.prefilter, self.prefilter_fp_rate = prefilter, prefilter_fp_rate
+        self.filter_negatives = 0  # absent keys the filters answered without probing
+        self.filter_false_positives = 0  # absent keys the filters let through to a probe
+        self.table = self._new_table(cap)
+        self.size = 0  # to keep track of number of elements in the table
+        self.min_cap = cap
+        self.rehash_step = rehash_step
+        self.deletion, self.max_tombstones = deletion, max_tombstones
+        self.probe = probe
+        self.hash_fn = hash_fn
+        self.tombstones = 0  # number of DELETED slots in the current array
+        # incremental rehash state: the array being drained and the next slot to move from it
+        self.old, self.rehash_pos = None, 0
+
+    @property
+    def cap(self):
+        return self.table.cap
+
+    def hash(self, x, cap=None):
+        return self._key_hash(x) % (cap or self.cap)  # simple hash function
 
     def insert(self, x):
-        # this can be made dynamic by doubling the size and copying the elements
-        if self.size == self.cap:  # table full, can't insert
-            return False
-        if self.search(x) is True:  # key already present, won't insert
+        self._rehash_some(self.rehash_step)
+        h = self._key_hash(x)
+        if self._contains(h, x):  # key already present, won't insert
             return False
-        i = self.hash(x)
-        t = self.buckets
-        while t[i] not in (-1, -2):  # -1 is empty slot, -2 deleted
-            i = (i + 1) % self.cap  # increment the index in circular way
-
-        t[i] = x
-        self.size += 1
+        self._add(h, x)
         return True
 
     def search(self, x):
-        h = self.hash(x)
-        t = self.buckets
-        i = h  # start with the index corresponding to hash
-        while (t[i] != -1):  # -1 is empty slot, continue search till we encounter an empty slot
-            if t[i] == x:  # found it
-                return True
-            i = (i + 1) % self.cap # increment the index in circular way
-            if (i == h):  # search wrapped around as we are back at the original index, table full and x not present
-                return False
-        return False  # encountered an empty slot, x not present
+        self._rehash_some(self.rehash_step)
+        return self._contains(self._key_hash(x), x)
 
     def remove(self, x):
-        # the implementation is almost same as search
-        h = self.hash(x)
-        t = self.buckets
-        i = h # start with the index corresponding to hash
-        while t[i] != -1:
-            if t[i] == x:
-                t[i] = -2  # this is the only change, -2 denotes deletion
-                return True
-            i = (i + 1) % self.cap
-            if i == h:
-                return False
-        return False
+        self._rehash_some(self.rehash_step)
+        h = self._key_hash(x)
+        t = self.table
+        i = self._find(t, h, x)
+        if i != -1:
+            if self.deletion == "backward_shift":
+                self._shift_back(i)
+            else:
+                self._free(t, i, DELETED)
+                self.tombstones += 1
+        elif self.old is not None and (i := self._find(self.old, h, x)) >= self.rehash_pos:
+            # always a tombstone here, shifting could move a key below rehash_pos and lose it
+            t = self.old
+            self._free(t, i, DELETED)
+        else:
+            return False
+        if t.filter is not None:
+            t.filter.discard(h)
+        self.size -= 1
+        stale = self.table.filter.stale if self.table.filter is not None else 0
+        if self.cap > self.min_cap and self.size < self.min_load * self.cap:
+            self._resize(max(self.min_cap, next_prime(self.cap // 2)))
+        elif max(self.tombstones, stale) > self.max_tombstones * self.cap:
+            self._resize(self.cap)  # compaction, the new array has no tombstones and a fresh filter
+        return True
+
+    def reserve(self, n):
+        """
+        Make room for n keys at once. Any rehash is finished right away: a bulk load is going
+        to touch every slot anyway, and this way the keys aren't moved again by several resizes.
+        """
+        if n > self.max_load * self.cap:
+            self._resize(next_prime(int(n / self.max_load) + 1))
+        if self.old is not None:
+            self._rehash_some(self.old.cap)
+
+    def put_many(self, keys):
+        """
+        Insert a batch of keys (any iterable, including NumPy arrays) and return how many were new.
+        The table is sized for the whole batch up front and the hashes are computed in one pass,
+        so the loop only probes.
+        """
+        keys = as_list(keys)
+        self.reserve(self.size + len(keys))
+        contains, place = self._contains, self._place
+        added = 0
+        for h, x in zip(map(self._key_hash, keys), keys):
+            if not contains(h, x):
+                place(h, x, None)
+                added += 1
+        self.size += added
+        return added
+
+    def contains_many(self, keys):
+        keys = as_list(keys)
+        contains = self._contains
+        return [contains(h, x) for h, x in zip(map(self._key_hash, keys), keys)]
+
+    def filter_stats(self):
+        """
+        How the prefilter did on lookups of absent keys so far: the measured false-positive
+        rate (the share of them that still had to probe) and the rate the current filter
+        is expected to have given the keys it holds.
+        """
+        f = self.table.filter
+        checked = self.filter_negatives + self.filter_false_positives
+        return {
+            "negatives": self.filter_negatives,
+            "false_positives": self.filter_false_positives,
+            "fp_rate": self.filter_false_positives / checked if checked else 0.0,
+            "expected_fp_rate": f.expected_fp_rate() if f is not None else 1.0,
+        }
+
+    # Slot hooks. The probing code works on (hash, key, value) entries and reads or writes
+    # slots only through these, so subclasses can change what a slot stores.
+
+    def _new_table(self, cap):
+        t = self._new_slots(cap)
+        n = int(self.max_load * cap) + 1
+        if self.prefilter == "bloom":
+            t.filter = BloomFilter(n, self.prefilter_fp_rate)
+        elif self.prefilter == "cuckoo":
+            t.filter = CuckooFilter(n)
+        return t
+
+    def _new_slots(self, cap):
+        return Slots(cap, [0] * cap)
+
+    def _key_hash(self, x):
+        return self.hash_fn(x)
+
+    def _slot_hash(self, t, i):
+        return self._key_hash(t.keys[i])
+
+    def _entry(self, t, i):
+        return self._slot_hash(t, i), t.keys[i], None
+
+    def _store(self, t, i, h, x, v):
+        t.keys[i] = x
+        t.states[i] = LIVE
+
+    def _move(self, t, i, j):
+        t.keys[i] = t.keys[j]
+
+    def _free(self, t, i, state):
+        t.states[i] = state
+
+    def _add(self, h, x, v=None):
+        """Store a key known to be absent and grow if needed"""
+        self._place(h, x, v)
+        self.size += 1
+        if self.size > self.max_load * self.cap:
+            self._resize(next_prime(2 * self.cap))
+
+    def _contains(self, h, x):
+        if self.prefilter:
+            return self._filtered_lookup(h, x)[0] is not None
+        if self._find(self.table, h, x) != -1:
+            return True
+        # a key found in the old array below rehash_pos is a stale copy of a moved key
+        return self.old is not None and self._find(self.old, h, x) >= self.rehash_pos
+
+    def _filtered_lookup(self, h, x):
+        """
+        (slots, index) holding x, (None, -1) when it's absent, probing an array only if its
+        filter lets x through. The outcome is counted once per lookup: a negative when the
+        filters of all the arrays ruled x out, a false positive when x is absent although a
+        filter let it through.
+        """
+        passed, all_rejected = False, True
+        for t, start in ((self.table, 0), (self.old, self.rehash_pos)):
+            if t is None:
+                continue
+            f = t.filter
+            if f is not None and not f.might_contain(h):
+                continue
+            passed = passed or f is not None
+            all_rejected = False
+            i = self._find(t, h, x)
+            if i >= start:  # below rehash_pos of the old array is a stale copy of a moved key
+                return t, i
+        if passed:
+            self.filter_false_positives += 1
+        elif all_rejected:
+            self.filter_negatives += 1
+        return None, -1
+
+    def _probe_start(self, h, cap):
+        """
+        First slot, first step and step increment of the probe sequence of a key with hash h.
+        The next slot is always (i + step) % cap, and the step grows by the increment,
+        i.e. quadratic probing visits h, h + 1, h + 1 + 3, h + 1 + 3 + 5 = h + 3^2 and so on.
+        """
+        if self.probe == "quadratic":
+            return h % cap, 1, 2
+        if self.probe == "double":
+            q = prev_prime(cap)
+            return h % cap, q - h % q, 0
+        return h % cap, 1, 0
+
+    def _find(self, t, h, x):
+        """Index of x in the slots t, -1 if it's not there"""
+        cap, keys, states = t.cap, t.keys, t.states
+        i, step, inc = self._probe_start(h, cap)  # start with the index corresponding to hash
+        robin_hood = self.probe == "robin_hood"
+        for n in range(cap):  # after cap probes the search has seen every reachable slot
+            s = states[i]
+            if s == EMPTY:  # encountered an empty slot, x not present
+                return -1
+            if s == LIVE:
+                if keys[i] == x:  # found it
+                    return i
+                if robin_hood and (i - self._slot_hash(t, i)) % cap < n:
+                    return -1  # x would have evicted this key, so it's not further down
+            i = (i + step) % cap
+            step += inc
+        return -1  # table full and x not present
+
+    def _place(self, h, x, v):
+        """Put an entry in the first free slot of its probe sequence. The load factor guarantees there is one."""
+        t = self.table
+        if t.filter is not None and not t.filter.add(h):
+            t.filter = None  # the cuckoo filter is full and lost a key, probe without it
+        cap, states = t.cap, t.states
+        i, step, inc = self._probe_start(h, cap)
+        if self.probe == "robin_hood":
+            dist = 0  # how far x is from its home slot
+            while states[i] != EMPTY:
+                k_dist = (i - self._slot_hash(t, i)) % cap
+                if k_dist < dist:  # the resident is richer, take its slot and carry it on
+                    evicted = self._entry(t, i)
+                    self._store(t, i, h, x, v)
+                    h, x, v = evicted
+                    dist = k_dist
+                i = (i + 1) % cap
+                dist += 1
+        else:
+            while states[i] == LIVE:
+                i = (i + step) % cap
+                step += inc
+            if states[i] == DELETED:
+                self.tombstones -= 1
+        self._store(t, i, h, x, v)
+
+    def _shift_back(self, i):
+        """
+        Backward-shift deletion for linear probing.
+
+        Empty slot i, then walk the rest of the cluster. A key at j can fill the hole at i
+        unless its home slot lies (circularly) in (i, j], since it would then sit before its
+        home slot and searches would never find it. A moved key leaves a new hole at j.
+        The walk stops at the first empty slot, which ends the cluster.
+        """
+        t = self.table
+        cap, states = t.cap, t.states
+        if self.probe == "robin_hood":
+            # keys of a robin hood cluster are ordered by distance from home, so shifting every key
+            # back by one until one sits in its home slot keeps that order
+            j = (i + 1) % cap
+            while states[j] == LIVE and self._slot_hash(t, j) % cap != j:
+                self._move(t, i, j)
+                i, j = j, (j + 1) % cap
+            self._free(t, i, EMPTY)
+            return
+        j = i
+        while True:
+            j = (j + 1) % cap
+            if states[j] == EMPTY:
+                break
+            k = self._slot_hash(t, j) % cap
+            if (k <= i or k > j) if i <= j else (k <= i and k > j):
+                self._move(t, i, j)
+                i = j
+        self._free(t, i, EMPTY)
+
+    def _live_slots(self):
+        """(slots, index) of every stored key, skipping the stale part of the old array"""
+        for t, start in ((self.table, 0), (self.old, self.rehash_pos)):
+            if t is not None:
+                states = t.states
+                for j in range(start, t.cap):
+                    if states[j] == LIVE:
+                        yield t, j
+
+    def probe_histogram(self):
+        """
+        Number of probes a successful search needs, for every key of the table:
+        {probes: number of keys}. Useful to compare probe strategies on real keys.
+        """
+        hist = Counter()
+        for t, j in self._live_slots():
+            i, step, inc = self._probe_start(self._slot_hash(t, j), t.cap)
+            n = 1
+            while i != j:
+                i = (i + step) % t.cap
+                step += inc
+                n += 1
+            hist[n] += 1
+        return hist
+
+    def probe_stats(self):
+        """Mean and max of probe_histogram"""
+        hist = self.probe_histogram()
+        if not hist:
+            return 0, 0
+        return sum(n * c for n, c in hist.items()) / sum(hist.values()), max(hist)
+
+    def _resize(self, new_cap):
+        if self.old is not None:  # previous rehash is still running, finish it first
+            self._rehash_some(self.old.cap)
+        self.old, self.rehash_pos = self.table, 0
+        self.table = self._new_table(new_cap)
+        self.tombstones = 0
+
+    def _rehash_some(self, n):
+        """Move the next n slots of the old array into the current one"""
+        old = self.old
+        if old is None:
+            return
+        end = min(self.rehash_pos + n, old.cap)
+        states = old.states
+        for j in range(self.rehash_pos, end):
+            if states[j] == LIVE:
+                self._place(*self._entry(old, j))
+        self.rehash_pos = end
+        if end == old.cap:  # done, drop the old array
+            self.old, self.rehash_pos = None, 0
+
+
+class CompactOpenAddressHash(OpenAddressHash):
+    """
+    OpenAddressHash for 64-bit integer keys. The keys live in a typed array("q") that holds
+    the raw 8 byte values, instead of a list of pointers to boxed int objects (8 + 28 bytes
+    per key). With the 1 byte state per slot that's 9 bytes per slot instead of ~37, and
+    every signed 64-bit value can be stored.
+    """
+
+    def insert(self, x):
+        if not INT64_MIN <= x <= INT64_MAX:
+            raise OverflowError(f"{x} doesn't fit in a signed 64-bit integer")
+        return super().insert(x)
+
+    def put_many(self, keys):
+        keys = as_list(keys)
+        if keys and not (INT64_MIN <= min(keys) and max(keys) <= INT64_MAX):
+            raise OverflowError("keys don't fit in a signed 64-bit integer")
+        return super().put_many(keys)
+
+    def _new_slots(self, cap):
+        return Slots(cap, array("q", bytes(8 * cap)))
+
+
+class MappedOpenAddressHash(CompactOpenAddressHash):
+    """
+    CompactOpenAddressHash whose slots live in a memory-mapped file laid out as
+        header: magic, capacity, size, tombstones, hash seed (padded to 64 bytes)
+        keys:   capacity x 8 byte signed integers
+        states: capacity x 1 byte
+    Opening an existing file maps it and reads the header, which is O(1) whatever the
+    size of the table. The OS loads a page the first time a probe touches it, and all the
+    processes that open the file read-only share one copy of it in the page cache.
+
+    The capacity is fixed when the file is created, and insert returns False once the table
+    is full, like the original fixed size OpenAddressHash did. Probing is linear and the hash
+    function is UniversalHash(seed) with the seed from the header, so every process hashes
+    the keys the same way. size and tombstones are written back to the header by flush().
+    """
+
+    HEADER = struct.Struct("<8s4q")
+    HEADER_SIZE = 64
+    MAGIC = b"OAHASH02"  # 02: UniversalHash splits the key in two words
+
+    def __init__(self, path, cap=None, max_load=0.7, max_tombstones=0.2, seed=None, writable=True):
+        """
+        Open the table stored at path, or create it with cap slots if cap is given
+        (overwriting the file). seed is random unless given.
+        """
+        if cap is None:
+            with open(path, "r+b" if writable else "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            magic, cap, size, tombstones, seed = self.HEADER.unpack_from(self.mm)
+            if magic != self.MAGIC:
+                self.mm.close()
+                raise ValueError(f"{path} is not a MappedOpenAddressHash file")
+        else:
+            size = tombstones = 0
+            seed = random.getrandbits(63) if seed is None else seed
+            with open(path, "w+b") as f:
+                f.truncate(self.HEADER_SIZE + 9 * cap)  # zero filled, i.e. every slot EMPTY
+                self.mm = mmap.mmap(f.fileno(), 0)
+        self.writable = writable
+        super().__init__(cap, max_load=max_load, min_load=0, max_tombstones=max_tombstones, hash_fn=UniversalHash(seed))
+        self.size, self.tombstones, self.seed = size, tombstones, seed
+        if writable:
+            self.flush()
+
+    def insert(self, x):
+        if self.size + 1 > self.max_load * self.cap:  # table full, can't insert
+            return False
+        return super().insert(x)
+
+    def reserve(self, n):
+        if n > self.max_load * self.cap:
+            raise ValueError("the table is full, create it with a bigger capacity")
+
+    def flush(self):
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.cap, self.size, self.tombstones, self.seed)
+        self.mm.flush()
+
+    def close(self):
+        if self.writable:
+            self.flush()
+        self.table.keys.release()  # the map can't be closed while views into it exist
+        self.table.states.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _new_slots(self, cap):
+        mv = memoryview(self.mm)
+        keys_end = self.HEADER_SIZE + 8 * cap
+        return Slots(cap, mv[self.HEADER_SIZE : keys_end].cast("q"), mv[keys_end : keys_end + cap])
+
+    def _resize(self, new_cap):
+        # the capacity never changes, so this is a compaction: rebuild the slots in place
+        t = self.table
+        keys = [t.keys[j] for j in range(t.cap) if t.states[j] == LIVE]
+        t.states[:] = bytes(t.cap)
+        self.tombstones = 0
+        for x in keys:
+            self._place(self._key_hash(x), x, None)
+
+
+class MapSlots(Slots):
+    def __init__(self, cap):
+        super().__init__(cap, [None] * cap)
+        self.values = [None] * cap
+        self.hashes = [0] * cap  # hash_fn(key), computed once when the key is stored
+
+
+class OpenAddressMap(OpenAddressHash, MutableMapping):
+    """
+    Dict-like open addressing map (takes the same options as OpenAddressHash).
+
+    Keys, values and the hashes of the keys live in parallel arrays. hash_fn (hash() by
+    default) is called once per operation; probing, robin hood distances, backward shifts
+    and rehashing all use the stored hash, so growing the table never hashes a key again,
+    and a search compares the hashes before calling the (possibly expensive) key equality.
+
+    Lookups and updates of existing keys don't move any slots of an ongoing rehash, so the
+    map can be read and updated while iterating over it. Adding or removing keys during
+    iteration raises RuntimeError, like dict does.
+    """
+
+    def __init__(self, cap=8, hash_fn=hash, **kwargs):
+        super().__init__(cap, hash_fn=hash_fn, **kwargs)
+
+    def __getitem__(self, key):
+        t, i = self._lookup(self.hash_fn(key), key)
+        if t is None:
+            raise KeyError(key)
+        return t.values[i]
+
+    def __setitem__(self, key, value):
+        h = self.hash_fn(key)
+        t, i = self._lookup(h, key)
+        if t is not None:  # existing key, replace the value
+            t.values[i] = value
+            return
+        self._rehash_some(self.rehash_step)
+        self._add(h, key, value)
+
+    def __delitem__(self, key):
+        if not self.remove(key):
+            raise KeyError(key)
+
+    def put_many(self, keys, values):
+        """Batch version of map[key] = value for parallel sequences (or NumPy arrays)"""
+        keys = as_list(keys)
+        self.reserve(self.size + len(keys))
+        lookup, place = self._lookup, self._place
+        added = 0
+        for h, key, value in zip(map(self.hash_fn, keys), keys, as_list(values)):
+            t, i = lookup(h, key)
+            if t is not None:
+                t.values[i] = value
+            else:
+                place(h, key, value)
+                added += 1
+        self.size += added
+        return added
+
+    def get_many(self, keys, default=None):
+        """Values of a batch of keys, default for the missing ones"""
+        keys = as_list(keys)
+        lookup = self._lookup
+        res = []
+        for h, key in zip(map(self.hash_fn, keys), keys):
+            t, i = lookup(h, key)
+            res.append(default if t is None else t.values[i])
+        return res
+
+    def __iter__(self):
+        size = self.size
+        for t, j in self._live_slots():
+            yield t.keys[j]
+            if self.size != size:
+                raise RuntimeError("OpenAddressMap changed size during iteration")
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return self._lookup(self.hash_fn(key), key)[0] is not None
+
+    def _lookup(self, h, key):
+        """(slots, index) holding key, (None, -1) when it's absent"""
+        if self.prefilter:
+            return self._filtered_lookup(h, key)
+        i = self._find(self.table, h, key)
+        if i != -1:
+            return self.table, i
+        if self.old is not None and (i := self._find(self.old, h, key)) >= self.rehash_pos:
+            return self.old, i
+        return None, -1
+
+    def _new_slots(self, cap):
+        return MapSlots(cap)
+
+    def _slot_hash(self, t, i):
+        return t.hashes[i]
+
+    def _entry(self, t, i):
+        return t.hashes[i], t.keys[i], t.values[i]
+
+    def _store(self, t, i, h, x, v):
+        t.hashes[i], t.keys[i], t.values[i] = h, x, v
+        t.states[i] = LIVE
+
+    def _move(self, t, i, j):
+        t.hashes[i], t.keys[i], t.values[i] = t.hashes[j], t.keys[j], t.values[j]
+
+    def _free(self, t, i, state):
+        t.keys[i] = t.values[i] = None  # don't keep removed keys and values alive
+        t.states[i] = state
+
+    def _find(self, t, h, x):
+        # same as OpenAddressHash._find, but compares the stored hashes first
+        cap, keys, hashes, states = t.cap, t.keys, t.hashes, t.states
+        i, step, inc = self._probe_start(h, cap)
+        robin_hood = self.probe == "robin_hood"
+        for n in range(cap):
+            s = states[i]
+            if s == EMPTY:
+                return -1
+            if s == LIVE:
+                if hashes[i] == h and (keys[i] is x or keys[i] == x):
+                    return i
+                if robin_hood and (i - hashes[i]) % cap < n:
+                    return -1
+            i = (i + step) % cap
+            step += inc
+        return -1
+
+
+def bench_concurrent_map(n_ops=50_000, write_ratio=0.2):
+    """
+    Throughput of ConcurrentChainHash against a ChainHash behind one global lock, for a mix
+    of reads and writes spread over 1 to 8 threads. On a GIL build only one thread runs
+    Python code at a time, so expect the striped map to win only on free-threaded builds.
+    """
+
+    class GlobalLockHash:
+        def __init__(self):
+            self.chain_hash, self.lock = ChainHash(), threading.Lock()
+
+        def get_val(self, key):
+            with self.lock:
+                return self.chain_hash.get_val(key)
+
+        def put_val(self, key, val):
+            with self.lock:
+                self.chain_hash.put_val(key, val)
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"{n_ops} ops per thread, {write_ratio:.0%} writes, GIL {'enabled' if gil else 'disabled'}")
+    print(f"{'threads':>8} {'global lock':>14} {'striped':>14}")
+    for n_threads in (1, 2, 4, 8):
+        res = []
+        for table in (GlobalLockHash(), ConcurrentChainHash()):
+            rngs = [random.Random(t) for t in range(n_threads)]
+            ops = [[(rng.random() < write_ratio, rng.randrange(100_000)) for _ in range(n_ops)] for rng in rngs]
+
+            def worker(thread_ops, table=table):
+                for write, key in thread_ops:
+                    if write:
+                        table.put_val(key, key)
+                    else:
+                        table.get_val(key)
+
+            threads = [threading.Thread(target=worker, args=(thread_ops,)) for thread_ops in ops]
+            start = time.perf_counter()
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+            res.append(n_threads * n_ops / (time.perf_counter() - start))
+        print(f"{n_threads:>8} {res[0]:>10.0f} op/s {res[1]:>10.0f} op/s")
 
 
 class HashTests(unittest.TestCase):
@@ -293,6 +2041,435 @@ class HashTests(unittest.TestCase):
         chain_hash.delete_val("name")
         self.assertIsNone(chain_hash.get_val("name"))
 
+    def test_chainhash_batch(self):
+        chain_hash = ChainHash()
+        chain_hash.put_many(range(100), (x * x for x in range(100)))
+        chain_hash.put_many([5], ["five"])
+        self.assertEqual(chain_hash.get_many([3, 5, 100], default=-1), [9, "five", -1])
+        self.assertEqual(chain_hash.contains_many([99, 100]), [True, False])
+
+        chain_hash = ChainHash(incremental=True, rehash_step=1)
+        for x in range(8):  # the 8th record starts a rehash
+            chain_hash.put_val(x, x)
+        self.assertEqual(chain_hash.get_many(range(9)), list(range(8)) + [None])
+        self.assertEqual(chain_hash.contains_many([0, 7, 8]), [True, True, False])
+        self.assertIsNotNone(chain_hash.old_buckets)  # batch reads didn't finish the rehash
+
+    def test_chainhash_resize(self):
+        for incremental in (False, True):
+            chain_hash = ChainHash(incremental=incremental)
+            for x in range(1000):
+                chain_hash.put_val(x, -x)
+                if incremental and x == 7:  # the 8th record crossed ⍺ = 1, the move has just started
+                    self.assertIsNotNone(chain_hash.old_buckets)
+            self.assertEqual(chain_hash.count, 1000)
+            self.assertTrue(is_prime(chain_hash.size))
+            self.assertLessEqual(chain_hash.count, chain_hash.max_load * chain_hash.size)
+            self.assertTrue(all(chain_hash.get_val(x) == -x for x in range(1000)))
+            for x in range(500):
+                chain_hash.delete_val(x)
+            self.assertEqual(chain_hash.count, 500)
+            self.assertIsNone(chain_hash.get_val(0))
+            self.assertEqual(chain_hash.get_val(999), -999)
+
+    def test_hash_functions(self):
+        fns = [FibonacciHash(), UniversalHash(seed=1), TabulationHash(seed=1)]
+        for fn in fns:
+            self.assertEqual(fn(12345), fn(12345))
+            self.assertTrue(0 <= fn(-1) <= MASK64)
+        self.assertNotEqual(UniversalHash(seed=1)(5), UniversalHash(seed=2)(5))  # a new function per table
+        for seed in range(20):  # negative keys used to collide with k + 8 whatever the seed
+            universal = UniversalHash(seed)
+            keys = [k for k in range(-1000, 1000) if k != -1]  # hash(-1) is -2 in CPython
+            self.assertEqual(len({universal(k) for k in keys}), len(keys))
+            self.assertNotEqual(universal(-5), universal(3))
+        self.assertEqual(PolynomialHash()("ab"), 97 + 98 * 33)
+        self.assertEqual(PolynomialHash()(b"ab"), PolynomialHash()("ab"))
+
+        keys = range(0, 7 * 700, 7)  # strided ids, all in bucket 0 with key % 7
+        for fn in [identity_hash] + fns:
+            chain_hash = ChainHash(max_load=float("inf"), hash_fn=fn)
+            chain_hash.put_many(keys, keys)
+            longest = max(len(bucket) for bucket in chain_hash.buckets)
+            self.assertEqual(longest, 700) if fn is identity_hash else self.assertLess(longest, 200)
+            self.assertEqual(chain_hash.get_many([0, 7, 8]), [0, 7, None])
+
+        for fn in fns:
+            oa_hash = OpenAddressHash(7, probe="double", hash_fn=fn)
+            oa_hash.put_many(keys)
+            self.assertTrue(all(oa_hash.contains_many(keys)))
+            oa_map = OpenAddressMap(hash_fn=PolynomialHash())
+            oa_map["frodo"] = "baggins"
+            self.assertEqual(oa_map["frodo"], "baggins")
+
+    def test_concurrent_chainhash(self):
+        conc_hash = ConcurrentChainHash(n_stripes=4)
+        conc_hash.put_val("name", "frodo")
+        self.assertEqual(conc_hash.get_val("name"), "frodo")
+        self.assertIsNone(conc_hash.get_val("ring"))
+
+        def worker(t):
+            for x in range(2000):
+                conc_hash.put_val((t, x), x)
+                self.assertEqual(conc_hash.get_val((t, x)), x)
+                if x % 2:
+                    conc_hash.delete_val((t, x - 1))
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(conc_hash), 8 * 1000 + 1)
+        self.assertTrue(all(conc_hash.get_val((t, x)) == x for t in range(8) for x in range(1, 2000, 2)))
+        self.assertTrue(all(conc_hash.get_val((t, x)) is None for t in range(8) for x in range(0, 2000, 2)))
+        self.assertEqual(conc_hash.versions, [v for v in conc_hash.versions if v % 2 == 0])
+
+    def test_cache_lru(self):
+        cache = Cache(capacity=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # b is now the least recently used
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions, len(cache)), (3, 1, 1, 2))
+        self.assertRaises(ValueError, Cache, capacity=0)
+
+    def test_cache_lfu(self):
+        cache = Cache(capacity=2, policy="lfu")
+        cache.put("a", 1)
+        cache.put("b", 2)
+        for _ in range(3):
+            cache.get("a")
+        cache.get("b")
+        cache.put("c", 3)  # b has fewer hits than a
+        self.assertIsNone(cache.get("b"))
+        cache.delete("c")
+        cache.put("d", 4)
+        cache.put("e", 5)  # d and e both have 1 access, d is older
+        self.assertEqual((cache.get("a"), cache.get("d"), cache.get("e")), (1, None, 5))
+
+    def test_cache_ttl_and_bytes(self):
+        now = [0]
+        cache = Cache(policy="ttl", ttl=10, clock=lambda: now[0])
+        cache.put("a", 1)
+        now[0] = 5
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        now[0] = 12
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        cache.put("c", 3)  # b expires at 15, still fresh
+        self.assertEqual((len(cache), cache.expirations), (2, 1))
+        now[0] = 20
+        cache.put("d", 4)  # b is dropped on the way
+        self.assertEqual((len(cache), cache.expirations), (2, 2))
+
+        cache = Cache(max_bytes=100, sizeof=lambda key, val: len(val))
+        cache.put(1, "x" * 60)
+        cache.put(2, "y" * 30)
+        cache.put(3, "z" * 30)
+        self.assertEqual((cache.get(1), cache.nbytes), (None, 60))
+        cache.put(4, "w" * 101)  # larger than the whole budget, not cached
+        self.assertIsNone(cache.get(4))
+
+        calls = []
+
+        @Cache(capacity=10).memoize
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        self.assertEqual([square(3), square(3), square(4)], [9, 9, 16])
+        self.assertEqual(calls, [3, 4])
+
+    def test_sharded_hash(self):
+        with ShardedHash(n_shards=3, hash_fn=UniversalHash(seed=7)) as sharded:
+            keys = [f"user{i}" for i in range(1000)]
+            sharded.put_many(keys, range(1000))
+            sharded.put_val("user0", "zero")
+            self.assertEqual(len(sharded), 1000)
+            self.assertEqual(sharded.get_many(["user0", "user999", "nobody"]), ["zero", 999, None])
+
+            moved = sharded.resize(5)  # only the keys on the new shards' arcs move, ~2/5 of them
+            self.assertGreater(moved, 0)
+            self.assertLess(moved, 600)
+            self.assertEqual(len(sharded.shards), 5)
+            self.assertEqual(sharded.get_many(keys[1:]), list(range(1, 1000)))
+
+            hashes = [sharded.hash_fn(key) for key in keys]
+            before = [sharded.ring.owner(h) for h in hashes]
+            moved = sharded.resize(6)  # exactly the keys whose owner changed come back from the shards
+            self.assertEqual(moved, sum(b != sharded.ring.owner(h) for b, h in zip(before, hashes)))
+
+            sharded.resize(2)
+            sharded.delete_val("user0")
+            self.assertIsNone(sharded.get_val("user0"))
+            self.assertEqual(len(sharded), 999)
+            self.assertEqual(sharded.get_many(keys[1:]), list(range(1, 1000)))
+
+            with self.assertRaises(ValueError):  # checked before any shard is removed
+                sharded.resize(0)
+            self.assertEqual(len(sharded.shards), 2)
+            self.assertEqual(len(sharded), 999)
+        with self.assertRaises(ValueError):
+            ShardedHash(n_shards=0)
+
+    def test_chainhash_treeify(self):
+        chain_hash = ChainHash(max_load=float("inf"))  # never resizes, so multiples of 7 share bucket 0
+        for x in range(100):
+            chain_hash.put_val(x * 7, x)
+        bucket = chain_hash.buckets[0]
+        self.assertIsInstance(bucket, SortedBucket)
+        self.assertEqual(bucket.hashes, sorted(bucket.hashes))
+        self.assertTrue(all(chain_hash.get_val(x * 7) == x for x in range(100)))
+        self.assertIsNone(chain_hash.get_val(700))
+        for x in range(97):
+            chain_hash.delete_val(x * 7)
+        self.assertIsInstance(chain_hash.buckets[0], list)  # back to a plain chain
+        self.assertEqual(chain_hash.get_many([679, 686, 693]), [97, 98, 99])
+
+        class Key:  # same full hash for all, only equality tells them apart
+            def __init__(self, x):
+                self.x = x
+
+            def __hash__(self):
+                return 42
+
+            def __eq__(self, other):
+                return self.x == other.x
+
+        chain_hash = ChainHash()
+        for x in range(50):
+            chain_hash.put_val(Key(x), x)
+        self.assertTrue(all(chain_hash.get_val(Key(x)) == x for x in range(50)))
+
+    def test_open_address_hash(self):
+        oa_hash = OpenAddressHash(7)
+        self.assertTrue(oa_hash.insert(49))
+        self.assertTrue(oa_hash.insert(56))  # collides with 49
+        self.assertFalse(oa_hash.insert(56))
+        self.assertTrue(oa_hash.search(56))
+        self.assertTrue(oa_hash.remove(49))
+        self.assertFalse(oa_hash.remove(49))
+        self.assertTrue(oa_hash.search(56))  # reachable past the deleted slot
+        self.assertFalse(oa_hash.search(49))
+        self.assertEqual(oa_hash.size, 1)
+
+    def test_open_address_hash_resize(self):
+        oa_hash = OpenAddressHash(7)
+        for x in range(1000):
+            self.assertTrue(oa_hash.insert(x * 7))
+            if oa_hash.old is not None:  # a resize moves at most rehash_step slots per operation
+                self.assertLessEqual(oa_hash.rehash_pos, oa_hash.old.cap)
+        self.assertEqual(oa_hash.size, 1000)
+        self.assertLessEqual(oa_hash.size, oa_hash.max_load * oa_hash.cap)
+        self.assertTrue(is_prime(oa_hash.cap))
+        self.assertTrue(all(oa_hash.search(x * 7) for x in range(1000)))
+        self.assertFalse(oa_hash.search(3))
+
+        for x in range(990):
+            self.assertTrue(oa_hash.remove(x * 7))
+        self.assertEqual(oa_hash.size, 10)
+        self.assertTrue(all(oa_hash.search(x * 7) for x in range(990, 1000)))
+        self.assertFalse(any(oa_hash.search(x * 7) for x in range(990)))
+        self.assertLess(oa_hash.cap, 100)
+
+    def test_open_address_hash_compaction(self):
+        oa_hash = OpenAddressHash(101, min_load=0)
+        for x in range(5000):  # churn: the live set stays at 50 keys
+            oa_hash.insert(x)
+            if x >= 50:
+                self.assertTrue(oa_hash.remove(x - 50))
+            self.assertLessEqual(oa_hash.tombstones, oa_hash.max_tombstones * oa_hash.cap)
+        self.assertEqual(oa_hash.cap, 101)
+        self.assertEqual(oa_hash.size, 50)
+        self.assertTrue(all(oa_hash.search(x) for x in range(4950, 5000)))
+        self.assertFalse(oa_hash.search(4949))
+
+    def test_open_address_hash_backward_shift(self):
+        oa_hash = OpenAddressHash(11, deletion="backward_shift", min_load=0)
+        for x in (1, 12, 23, 2, 3, 10, 21):  # one cluster wrapping around the end of the array
+            oa_hash.insert(x)
+        for x in (12, 10, 1):
+            self.assertTrue(oa_hash.remove(x))
+            self.assertNotIn(DELETED, oa_hash.table.states)
+        self.assertEqual(oa_hash.tombstones, 0)
+        self.assertTrue(all(oa_hash.search(x) for x in (23, 2, 3, 21)))
+        self.assertFalse(any(oa_hash.search(x) for x in (1, 12, 10)))
+
+    def test_open_address_hash_probing(self):
+        keys = random.Random(42).sample(range(10**9), 2000)
+        stats = {}
+        for probe in ("linear", "quadratic", "double", "robin_hood"):
+            oa_hash = OpenAddressHash(7, max_load=0.5, probe=probe)
+            for x in keys:
+                self.assertTrue(oa_hash.insert(x))
+            self.assertEqual(sum(oa_hash.probe_histogram().values()), 2000)
+            stats[probe] = oa_hash.probe_stats()
+            for x in keys[::2]:
+                self.assertTrue(oa_hash.remove(x))
+            self.assertTrue(all(oa_hash.search(x) for x in keys[1::2]))
+            self.assertFalse(any(oa_hash.search(x) for x in keys[::2]))
+        # robin hood keeps the mean of linear probing but cuts the longest probe sequence
+        self.assertAlmostEqual(stats["robin_hood"][0], stats["linear"][0])
+        self.assertLess(stats["robin_hood"][1], stats["linear"][1])
+
+    def test_compact_open_address_hash(self):
+        oa_hash = CompactOpenAddressHash(7)
+        for x in (-1, -2, 0, INT64_MIN, INT64_MAX):  # no value is reserved as a marker
+            self.assertTrue(oa_hash.insert(x))
+        self.assertRaises(OverflowError, oa_hash.insert, INT64_MAX + 1)
+        for x in range(1, 1001):
+            self.assertTrue(oa_hash.insert(x * 1_000_003))
+        self.assertTrue(all(oa_hash.search(x) for x in (-1, -2, 0, INT64_MIN, INT64_MAX)))
+        self.assertTrue(oa_hash.remove(-1))
+        self.assertFalse(oa_hash.search(-1))
+        self.assertEqual(oa_hash.size, 1004)
+        t = oa_hash.table
+        self.assertEqual(t.keys.itemsize + 1, 9)  # bytes per slot: the key plus its state
+        self.assertLess(len(t.keys) * t.keys.itemsize + len(t.states), 10 * t.cap)
+
+    def test_mapped_open_address_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ids.oah")
+            with MappedOpenAddressHash(path, cap=101) as oa_hash:
+                self.assertEqual(oa_hash.put_many(range(-35, 35)), 70)
+                self.assertFalse(oa_hash.insert(1000))  # 71 keys would go above max_load
+                self.assertRaises(ValueError, oa_hash.put_many, [1000])
+                seed = oa_hash.seed
+            self.assertEqual(os.path.getsize(path), 64 + 9 * 101)
+
+            with MappedOpenAddressHash(path, writable=False) as oa_hash:
+                self.assertEqual((oa_hash.cap, oa_hash.size, oa_hash.seed), (101, 70, seed))
+                self.assertTrue(all(oa_hash.contains_many(range(-35, 35))))
+                self.assertFalse(oa_hash.search(35))
+                self.assertRaises(TypeError, oa_hash.remove, 0)  # read-only mapping
+
+            with MappedOpenAddressHash(path) as oa_hash:
+                for x in range(-35, 0):  # enough tombstones to trigger an in place compaction
+                    self.assertTrue(oa_hash.remove(x))
+                self.assertLessEqual(oa_hash.tombstones, oa_hash.max_tombstones * oa_hash.cap)
+            with MappedOpenAddressHash(path, writable=False) as oa_hash:
+                self.assertEqual(oa_hash.size, 35)
+                self.assertEqual(oa_hash.contains_many([-1, 0, 34]), [False, True, True])
+
+    def test_open_address_map(self):
+        for probe in ("linear", "robin_hood"):
+            oa_map = OpenAddressMap(probe=probe)
+            for i in range(500):
+                oa_map[f"key{i}"] = i
+            oa_map["key0"] = "zero"
+            self.assertEqual(len(oa_map), 500)
+            self.assertEqual(oa_map["key0"], "zero")
+            self.assertEqual(oa_map.get("key499"), 499)
+            self.assertIsNone(oa_map.get("missing"))
+            self.assertEqual(oa_map.setdefault("key1", -1), 1)
+            self.assertEqual(oa_map.setdefault("new", -1), -1)
+            del oa_map["key2"]
+            self.assertRaises(KeyError, oa_map.__getitem__, "key2")
+            self.assertRaises(KeyError, oa_map.__delitem__, "key2")
+            self.assertNotIn("key2", oa_map)
+            expected = {f"key{i}": i for i in range(500) if i != 2} | {"key0": "zero", "new": -1}
+            self.assertDictEqual(dict(oa_map.items()), expected)
+            for key in oa_map:  # reading and updating while iterating is fine
+                oa_map[key] = oa_map[key]
+            with self.assertRaises(RuntimeError):
+                for key in oa_map:
+                    del oa_map[key]
+
+    def test_batch_operations(self):
+        oa_hash = CompactOpenAddressHash(7)
+        oa_hash.insert(2)
+        self.assertEqual(oa_hash.put_many(range(0, 20000, 2)), 9999)
+        self.assertEqual(oa_hash.size, 10000)
+        self.assertIsNone(oa_hash.old)  # sized once for the batch, nothing left to move
+        self.assertLessEqual(oa_hash.size, oa_hash.max_load * oa_hash.cap)
+        self.assertEqual(oa_hash.contains_many([0, 1, 2, 3, 19998, 20000]), [True, False, True, False, True, False])
+        self.assertRaises(OverflowError, oa_hash.put_many, [1, INT64_MAX + 1])
+
+        oa_map = OpenAddressMap()
+        self.assertEqual(oa_map.put_many(["a", "b", "a"], [1, 2, 3]), 2)
+        self.assertEqual(oa_map.get_many(["a", "b", "c"]), [3, 2, None])
+        self.assertEqual(oa_map.contains_many(["c", "b"]), [False, True])
+
+    def test_open_address_map_cached_hashes(self):
+        class Key:
+            hash_calls = 0
+
+            def __init__(self, x):
+                self.x = x
+
+            def __hash__(self):
+                Key.hash_calls += 1
+                return self.x
+
+            def __eq__(self, other):
+                return self.x == other.x
+
+        oa_map = OpenAddressMap(7)
+        for x in range(1000):  # goes through several resizes
+            oa_map[Key(x)] = x
+        self.assertEqual(Key.hash_calls, 1000)
+        self.assertEqual(oa_map[Key(10)], 10)
+
+    def test_prefilter(self):
+        keys = random.Random(7).sample(range(10**9), 4000)
+        present, absent = keys[:2000], keys[2000:]
+        for prefilter in ("bloom", "cuckoo"):
+            oa_hash = OpenAddressHash(7, prefilter=prefilter)
+            for x in present:  # grows through several arrays, each with its own filter
+                oa_hash.insert(x)
+            for x in present[::2]:
+                oa_hash.remove(x)
+            self.assertTrue(all(oa_hash.search(x) for x in present[1::2]))
+            self.assertFalse(any(oa_hash.search(x) for x in present[::2] + absent))
+            stats = oa_hash.filter_stats()
+            self.assertLess(stats["fp_rate"], 0.05)
+            self.assertLess(stats["expected_fp_rate"], 0.05)
+
+        oa_hash = OpenAddressHash(7, prefilter="bloom", rehash_step=1)
+        for x in range(5):  # the 5th key starts a rehash, most keys are still in the old array
+            oa_hash.insert(x)
+        self.assertIsNotNone(oa_hash.old)
+        negatives = oa_hash.filter_negatives
+        self.assertTrue(all(oa_hash.contains_many(range(5))))
+        self.assertEqual(oa_hash.filter_negatives, negatives)  # hits are never negatives
+        oa_hash.contains_many(range(1000, 1100))
+        stats = oa_hash.filter_stats()
+        self.assertEqual(stats["negatives"] + stats["false_positives"], negatives + 100)  # once per lookup
+
+        cuckoo = CuckooFilter(100)
+        cuckoo.add(42)
+        self.assertTrue(cuckoo.might_contain(42))
+        cuckoo.discard(42)
+        self.assertFalse(cuckoo.might_contain(42))
+        self.assertRaises(ValueError, OpenAddressHash, 7, prefilter="xor")
+
+    def test_perfect_hash(self):
+        keys = random.Random(3).sample(range(10**12), 5000) + ["apple", "pear", b"plum"]
+        perfect = PerfectHash(keys, range(len(keys)))
+        self.assertEqual(sorted(perfect.index(x) for x in keys), list(range(len(keys))))  # minimal
+        self.assertEqual(perfect.get_val("pear"), 5001)
+        self.assertEqual(perfect.index(10**12 + 1), -1)
+        self.assertNotIn("banana", perfect)
+        self.assertLess(perfect.bits_per_key(), 3.5)
+        self.assertRaises(ValueError, PerfectHash, [1, 2, 1])
+        wide = [-1, 2**64 - 1, 1, 2**64 + 1, -(2**63), 2**63, -(2**200), 2**200]  # equal modulo 2^64 in pairs
+        perfect_wide = PerfectHash(wide, range(len(wide)))
+        self.assertEqual([perfect_wide.get_val(x) for x in wide], list(range(len(wide))))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "keys.mph")
+            perfect.save(path)
+            loaded = PerfectHash.load(path)
+            self.assertEqual([loaded.index(x) for x in keys], [perfect.index(x) for x in keys])
+            self.assertEqual(loaded.get_val(b"plum"), 5002)
+
 
 if __name__ == "__main__":
-    unittest.main()
+    if sys.argv[1:] == ["bench"]:  # python hash-tables.py bench
+        bench_concurrent_map()
+    else:
+        unittest.main()
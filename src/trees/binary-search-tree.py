@@ -1,3 +1,7 @@
+import math
+import random
+import sys
+import time
 import unittest
 
 """
@@ -38,6 +42,15 @@ class Node:
         self.data = data
         self.left = None
         self.right = None
+        self.size = 1  # number of nodes in the subtree rooted here, kept up to date by insert/delete
+
+
+def size(root):
+    return root.size if root is not None else 0
+
+
+def _update_size(node):
+    node.size = 1 + size(node.left) + size(node.right)
 
 
 def inorder(root, acc):
@@ -91,6 +104,7 @@ def insert(root, data):
         root.left = insert(root.left, data)
     else:
         root.right = insert(root.right, data)
+    _update_size(root)
     return root
 
 
@@ -120,6 +134,11 @@ def insertIter(root, data):
         parent.left = new
     else:
         parent.right = new  # add as a right node
+    # data was new, walk the same path again to count it in the sizes of its ancestors
+    curr = root
+    while curr is not new:
+        curr.size += 1
+        curr = curr.left if curr.data > data else curr.right
     return root
 
 
@@ -168,6 +187,7 @@ def delete(root, data):
             root.right = delete(
                 root.right, successor.data
             )  # delete the inorder successor node
+    _update_size(root)
     return root
 
 
@@ -215,6 +235,511 @@ def ceil(root, val):
     return res
 
 
+"""
+Self-balancing BSTs
+
+Both keep the height O(log n) whatever the order of the inserts, by restructuring the tree
+with rotations on the way back up from an insert or delete. A rotation turns a parent-child
+edge around and keeps the inorder sequence (so the BST property) intact:
+
+        y      rotate right       x
+       / \\     ------------>     / \\
+      x   C                     A   y
+     / \\       <------------       / \\
+    A   B       rotate left       B   C
+
+AVL tree: every node stores its height, and the heights of the two subtrees of any node
+differ by at most 1 (the balance factor is -1, 0 or 1). When an insert or delete breaks
+that, one rotation (left-left / right-right case) or two (left-right / right-left case)
+restore it. Height <= 1.44 log n, the shortest of the two, so the fastest searches.
+
+Red-black tree: every node is red or black, no red node has a red child, and every path
+from a node down to a leaf has the same number of black nodes, which makes the height
+<= 2 log n. The version here is the left-leaning red-black tree (Sedgewick), where red
+nodes are always left children: a 2-3 tree in disguise, with a red node glued to its
+parent as one 3-node. Fewer rotations than AVL on updates.
+
+avl_insert/avl_delete and rb_insert/rb_delete replace insert/delete and, like them,
+return the new root. The nodes are Nodes with extra fields, so search, searchIter, floor,
+ceil and inorder work unchanged on balanced trees.
+"""
+
+
+class AVLNode(Node):
+    def __init__(self, data):
+        super().__init__(data)
+        self.height = 1  # height of the subtree rooted here, a leaf has height 1
+
+
+def height(root):
+    """Height of any tree (iterative, so it also works on a degenerate one)"""
+    h, level = 0, [root] if root is not None else []
+    while level:
+        h += 1
+        level = [c for node in level for c in (node.left, node.right) if c is not None]
+    return h
+
+
+def _avl_height(node):
+    return node.height if node is not None else 0
+
+
+def _avl_update(node):
+    node.height = 1 + max(_avl_height(node.left), _avl_height(node.right))
+    _update_size(node)
+
+
+def _avl_rotate_right(y):
+    x = y.left
+    y.left, x.right = x.right, y
+    _avl_update(y)  # y is below x now, update it first
+    _avl_update(x)
+    return x
+
+
+def _avl_rotate_left(x):
+    y = x.right
+    x.right, y.left = y.left, x
+    _avl_update(x)
+    _avl_update(y)
+    return y
+
+
+def _avl_rebalance(node):
+    """Update the height of node and rotate if its balance factor went out of [-1, 1]"""
+    _avl_update(node)
+    balance = _avl_height(node.left) - _avl_height(node.right)
+    if balance > 1:  # left heavy
+        if _avl_height(node.left.left) < _avl_height(node.left.right):  # left-right case
+            node.left = _avl_rotate_left(node.left)
+        return _avl_rotate_right(node)
+    if balance < -1:  # right heavy
+        if _avl_height(node.right.right) < _avl_height(node.right.left):  # right-left case
+            node.right = _avl_rotate_right(node.right)
+        return _avl_rotate_left(node)
+    return node
+
+
+def avl_insert(root, data):
+    """
+    Time complexity: O(log n)
+    Aux space: O(log n)
+    """
+    if root is None:
+        return AVLNode(data)
+    elif root.data == data:
+        return root
+    elif root.data > data:
+        root.left = avl_insert(root.left, data)
+    else:
+        root.right = avl_insert(root.right, data)
+    return _avl_rebalance(root)
+
+
+def avl_delete(root, data):
+    """
+    Time complexity: O(log n)
+    Aux space: O(log n)
+
+    Same three cases as delete, then every node on the path back up is rebalanced.
+    """
+    if root is None:
+        return None
+    if root.data > data:
+        root.left = avl_delete(root.left, data)
+    elif root.data < data:
+        root.right = avl_delete(root.right, data)
+    else:
+        if root.left is None:
+            return root.right
+        if root.right is None:
+            return root.left
+        successor = __find_successor(root.right)
+        root.data = successor.data
+        root.right = avl_delete(root.right, successor.data)
+    return _avl_rebalance(root)
+
+
+RED, BLACK = True, False
+
+
+class RBNode(Node):
+    def __init__(self, data):
+        super().__init__(data)
+        self.color = RED  # color of the link from the parent, new nodes are always red
+
+
+def _is_red(node):
+    return node is not None and node.color == RED
+
+
+def _rb_rotate_left(h):
+    x = h.right
+    h.right, x.left = x.left, h
+    x.color, h.color = h.color, RED
+    x.size = h.size  # x roots the same subtree h did
+    _update_size(h)
+    return x
+
+
+def _rb_rotate_right(h):
+    x = h.left
+    h.left, x.right = x.right, h
+    x.color, h.color = h.color, RED
+    x.size = h.size
+    _update_size(h)
+    return x
+
+
+def _rb_flip_colors(h):
+    """Split a temporary 4-node (both children red), or join one on the way down a delete"""
+    h.color = not h.color
+    h.left.color = not h.left.color
+    h.right.color = not h.right.color
+
+
+def _rb_balance(h):
+    if _is_red(h.right) and not _is_red(h.left):  # right-leaning red link
+        h = _rb_rotate_left(h)
+    if _is_red(h.left) and _is_red(h.left.left):  # two red links in a row
+        h = _rb_rotate_right(h)
+    if _is_red(h.left) and _is_red(h.right):  # 4-node
+        _rb_flip_colors(h)
+    _update_size(h)
+    return h
+
+
+def _rb_insert(h, data):
+    if h is None:
+        return RBNode(data)
+    if h.data == data:
+        return h
+    if h.data > data:
+        h.left = _rb_insert(h.left, data)
+    else:
+        h.right = _rb_insert(h.right, data)
+    return _rb_balance(h)
+
+
+def rb_insert(root, data):
+    """
+    Time complexity: O(log n)
+    Aux space: O(log n)
+    """
+    root = _rb_insert(root, data)
+    root.color = BLACK
+    return root
+
+
+def _rb_move_red_left(h):
+    # h is red and h.left, h.left.left black: make h.left or one of its children red
+    _rb_flip_colors(h)
+    if _is_red(h.right.left):
+        h.right = _rb_rotate_right(h.right)
+        h = _rb_rotate_left(h)
+        _rb_flip_colors(h)
+    return h
+
+
+def _rb_move_red_right(h):
+    _rb_flip_colors(h)
+    if _is_red(h.left.left):
+        h = _rb_rotate_right(h)
+        _rb_flip_colors(h)
+    return h
+
+
+def _rb_delete_min(h):
+    if h.left is None:
+        return None
+    if not _is_red(h.left) and not _is_red(h.left.left):
+        h = _rb_move_red_left(h)
+    h.left = _rb_delete_min(h.left)
+    return _rb_balance(h)
+
+
+def _rb_delete(h, data):
+    # on the way down the current node is never a 2-node, so the deleted node is never a 2-node
+    # either and removing it keeps the black height. The way back up fixes the 4-nodes made.
+    if data < h.data:
+        if not _is_red(h.left) and not _is_red(h.left.left):
+            h = _rb_move_red_left(h)
+        h.left = _rb_delete(h.left, data)
+    else:
+        if _is_red(h.left):
+            h = _rb_rotate_right(h)
+        if data == h.data and h.right is None:
+            return None
+        if not _is_red(h.right) and not _is_red(h.right.left):
+            h = _rb_move_red_right(h)
+        if data == h.data:
+            h.data = __find_successor(h.right).data
+            h.right = _rb_delete_min(h.right)
+        else:
+            h.right = _rb_delete(h.right, data)
+    return _rb_balance(h)
+
+
+def rb_delete(root, data):
+    """
+    Time complexity: O(log n)
+    Aux space: O(log n)
+    """
+    if not searchIter(root, data):  # the top-down restructuring assumes data is in the tree
+        return root
+    if not _is_red(root.left) and not _is_red(root.right):
+        root.color = RED
+    root = _rb_delete(root, data)
+    if root is not None:
+        root.color = BLACK
+    return root
+
+
+"""
+Order statistics
+
+Every node stores the size of its subtree (1 + size of left + size of right). insert, delete
+and the balanced versions keep it up to date: it only changes along the path from the root
+to the inserted or deleted node, and the rotations recompute it for the 2 nodes they move.
+
+With the sizes, the position of a key in sorted order can be found on the way down:
+going right past a node skips its left subtree and the node itself, size(left) + 1 keys.
+So rank, select and range counts cost O(h), O(log n) on a balanced tree, instead of an
+inorder walk. Percentiles of a sliding window of latencies: insert the new values, delete
+the expired ones and ask for percentile(root, 99). Keys must be distinct, so store
+(latency, sequence number) pairs when values can repeat.
+"""
+
+
+def rank(root, val):
+    """
+    Number of keys smaller than val (the index val has, or would have, in sorted order)
+
+    Time complexity: O(h)
+    Aux space: O(1)
+    """
+    res = 0
+    while root is not None:
+        if root.data < val:
+            res += size(root.left) + 1  # root and its whole left subtree are smaller
+            root = root.right
+        else:
+            root = root.left
+    return res
+
+
+def select(root, k):
+    """
+    Node with the k-th smallest key, counting from 0, None if k is out of range
+
+    Time complexity: O(h)
+    Aux space: O(1)
+    """
+    while root is not None:
+        left = size(root.left)
+        if k < left:
+            root = root.left
+        elif k == left:
+            return root
+        else:
+            k -= left + 1  # skip the left subtree and root
+            root = root.right
+    return None
+
+
+def count_range(root, lo, hi):
+    """Number of keys x with lo <= x <= hi, O(h)"""
+    if hi < lo:
+        return 0
+    # keys < hi, plus hi itself
+    return rank(root, hi) + searchIter(root, hi) - rank(root, lo)
+
+
+def percentile(root, p):
+    """
+    Key at the p-th percentile (0 < p <= 100) by the nearest-rank method: the smallest key
+    that at least p% of the keys are less than or equal to. None for an empty tree.
+    """
+    n = size(root)
+    if n == 0:
+        return None
+    k = max(0, math.ceil(p / 100 * n) - 1)
+    return select(root, min(k, n - 1)).data
+
+
+"""
+Lazy iteration
+
+inorder builds the whole sorted list. A cursor instead keeps the path from the root down
+to its current node, O(h) memory, and moves to the successor or predecessor in amortised
+O(1) (O(h) at worst):
+    - successor: the leftmost node of the right subtree if there is one, otherwise the
+      nearest ancestor whose left subtree we're in (climb while we're a right child).
+    - predecessor: the mirror image.
+Seeking to the first key >= x is ceil, remembering the path on the way down (and floor for
+the last key <= x), so a scan can start anywhere in O(h) and stop whenever the caller does.
+A cursor that stepped off either end has an empty path and remembers which end it left by,
+so moving back in from after the last key lands on the last key and moving forward from
+before the first key lands on the first. The tree must not be modified while a cursor is
+in use.
+"""
+
+
+class Cursor:
+    def __init__(self, root, path, after_last=False):
+        self.root = root
+        self.path = path  # nodes from the root down to the current node, empty when off either end
+        self.after_last = after_last  # with an empty path: past the last key, else before the first
+
+    @property
+    def node(self):
+        return self.path[-1] if self.path else None
+
+    def next(self):
+        """Move to the successor and return it (None once past the last key)"""
+        path = self.path
+        if not path:
+            if not self.after_last:  # before the first key
+                self.path = first(self.root).path
+            return self.node
+        node = path[-1].right
+        if node is not None:
+            while node is not None:  # leftmost node of the right subtree
+                path.append(node)
+                node = node.left
+        else:
+            child = path.pop()
+            while path and path[-1].right is child:  # climb out of right subtrees
+                child = path.pop()
+            self.after_last = True
+        return self.node
+
+    def prev(self):
+        """Move to the predecessor and return it (None once past the first key)"""
+        path = self.path
+        if not path:
+            if self.after_last:
+                self.path = last(self.root).path
+            return self.node
+        node = path[-1].left
+        if node is not None:
+            while node is not None:
+                path.append(node)
+                node = node.right
+        else:
+            child = path.pop()
+            while path and path[-1].left is child:
+                child = path.pop()
+            self.after_last = False
+        return self.node
+
+
+def first(root):
+    """Cursor on the smallest key"""
+    path, node = [], root
+    while node is not None:
+        path.append(node)
+        node = node.left
+    return Cursor(root, path)
+
+
+def last(root):
+    """Cursor on the largest key"""
+    path, node = [], root
+    while node is not None:
+        path.append(node)
+        node = node.right
+    return Cursor(root, path, after_last=True)
+
+
+def seek_ceil(root, val):
+    """Cursor on the smallest key >= val (same walk as ceil), after the last key if there's none"""
+    path, keep, node = [], 0, root  # keep: length of the path up to the best candidate so far
+    while node is not None:
+        path.append(node)
+        if node.data == val:
+            return Cursor(root, path)
+        elif node.data < val:
+            node = node.right
+        else:
+            keep = len(path)
+            node = node.left
+    return Cursor(root, path[:keep], after_last=True)
+
+
+def seek_floor(root, val):
+    """Cursor on the largest key <= val (same walk as floor), before the first key if there's none"""
+    path, keep, node = [], 0, root
+    while node is not None:
+        path.append(node)
+        if node.data == val:
+            return Cursor(root, path)
+        elif node.data > val:
+            node = node.left
+        else:
+            keep = len(path)
+            node = node.right
+    return Cursor(root, path[:keep])
+
+
+def _walk(cursor, reverse):
+    node = cursor.node
+    step = cursor.prev if reverse else cursor.next
+    while node is not None:
+        yield node.data
+        node = step()
+
+
+def iter_inorder(root, reverse=False):
+    """Keys in sorted order (descending with reverse), lazily"""
+    return _walk(last(root) if reverse else first(root), reverse)
+
+
+def iter_from(root, val, reverse=False):
+    """Keys >= val in ascending order, or with reverse keys <= val in descending order"""
+    return _walk(seek_floor(root, val) if reverse else seek_ceil(root, val), reverse)
+
+
+def iter_range(root, lo, hi, reverse=False):
+    """Keys x with lo <= x <= hi, ascending (descending with reverse)"""
+    if reverse:
+        for x in iter_from(root, hi, reverse=True):
+            if x < lo:
+                return
+            yield x
+    else:
+        for x in iter_from(root, lo):
+            if x > hi:
+                return
+            yield x
+
+
+def bench_balanced(n=5000):
+    """
+    Insert n keys in sorted, reverse sorted and random order, then search them all, with
+    insertIter (plain BST), avl_insert and rb_insert. The plain tree is a linked list for the
+    sorted streams, so its searches walk O(n) nodes (searchIter, search would hit the
+    recursion limit).
+    """
+    streams = {
+        "sorted": list(range(n)),
+        "reverse": list(range(n, 0, -1)),
+        "random": random.Random(0).sample(range(n), n),
+    }
+    for name, keys in streams.items():
+        for engine, insert_fn in [("plain", insertIter), ("avl", avl_insert), ("rb", rb_insert)]:
+            start = time.perf_counter()
+            root = None
+            for x in keys:
+                root = insert_fn(root, x)
+            t_insert = time.perf_counter() - start
+            start = time.perf_counter()
+            for x in keys:
+                searchIter(root, x)
+            t_search = time.perf_counter() - start
+            print(f"{name:<8} {engine:<6} height {height(root):>5}  insert {t_insert:6.3f}s  search {t_search:6.3f}s")
+
+
 class BinarySearchTreeTests(unittest.TestCase):
     def create_test_bst(self):
         """
@@ -323,6 +848,111 @@ class BinarySearchTreeTests(unittest.TestCase):
         self.assertEqual(ceil(root, 26).data, 30)
         self.assertIsNone(ceil(root, 50))
 
+    def check_balanced(self, root, engine):
+        """Height of the subtree, failing if root breaks the BST or balancing invariants"""
+        if root is None:
+            return 0
+        if root.left is not None:
+            self.assertLess(root.left.data, root.data)
+        if root.right is not None:
+            self.assertGreater(root.right.data, root.data)
+        lh, rh = self.check_balanced(root.left, engine), self.check_balanced(root.right, engine)
+        if engine == "avl":
+            self.assertLessEqual(abs(lh - rh), 1)
+            self.assertEqual(root.height, 1 + max(lh, rh))
+            return 1 + max(lh, rh)
+        self.assertFalse(_is_red(root.right))  # left-leaning
+        self.assertFalse(_is_red(root) and _is_red(root.left))
+        self.assertEqual(lh, rh)  # black height
+        return lh + (0 if _is_red(root) else 1)
+
+    def test_balanced_trees(self):
+        rng = random.Random(5)
+        for engine, insert_fn, delete_fn in [("avl", avl_insert, avl_delete), ("rb", rb_insert, rb_delete)]:
+            root, keys = None, set()
+            for x in list(range(500)) + rng.sample(range(500, 5000), 500):  # sorted, then random
+                root = insert_fn(root, x)
+                keys.add(x)
+            self.check_balanced(root, engine)
+            self.assertLessEqual(height(root), 2 * 10)  # 2 log n
+            for x in rng.sample(sorted(keys), 600) + [-1]:
+                root = delete_fn(root, x)
+                keys.discard(x)
+            self.check_balanced(root, engine)
+            res = []
+            inorder(root, res)
+            self.assertListEqual(res, sorted(keys))
+            self.assertTrue(search(root, res[0]))
+            self.assertEqual(floor(root, 10**6).data, res[-1])
+            self.assertEqual(ceil(root, -5).data, res[0])
+
+    def test_order_statistics(self):
+        rng = random.Random(6)
+        keys = rng.sample(range(0, 10000, 2), 1000)  # even keys, odd values are never in the tree
+        engines = [(insert, delete), (insertIter, delete), (avl_insert, avl_delete), (rb_insert, rb_delete)]
+        for insert_fn, delete_fn in engines:
+            root = None
+            for x in keys:
+                root = insert_fn(root, x)
+            root = insert_fn(root, keys[0])  # duplicate, sizes must not change
+            for x in keys[:300]:
+                root = delete_fn(root, x)
+            live = sorted(keys[300:])
+            self.assertEqual(size(root), 700)
+            self.assertEqual(rank(root, live[10]), 10)
+            self.assertEqual(rank(root, live[10] + 1), 11)
+            self.assertEqual([select(root, k).data for k in (0, 350, 699)], [live[0], live[350], live[699]])
+            self.assertIsNone(select(root, 700))
+            self.assertEqual(count_range(root, live[100], live[199]), 100)
+            self.assertEqual(count_range(root, live[100] + 1, live[199] - 1), 98)
+            self.assertEqual(percentile(root, 50), live[349])
+            self.assertEqual(percentile(root, 99), live[692])
+            self.assertEqual(percentile(root, 100), live[-1])
+        self.assertIsNone(percentile(None, 99))
+
+    def test_iterators(self):
+        root = self.create_test_bst()  # 2, 5, 10, 25, 30, 40
+        self.assertEqual(list(iter_inorder(root)), [2, 5, 10, 25, 30, 40])
+        self.assertEqual(list(iter_inorder(root, reverse=True)), [40, 30, 25, 10, 5, 2])
+        self.assertEqual(list(iter_from(root, 6)), [10, 25, 30, 40])
+        self.assertEqual(list(iter_from(root, 25, reverse=True)), [25, 10, 5, 2])
+        self.assertEqual(list(iter_range(root, 3, 30)), [5, 10, 25, 30])
+        self.assertEqual(list(iter_range(root, 3, 29, reverse=True)), [25, 10, 5])
+        self.assertEqual(list(iter_from(root, 41)), [])
+        self.assertEqual(list(iter_inorder(None)), [])
+
+        cursor = seek_ceil(root, 11)
+        self.assertEqual(cursor.node.data, 25)
+        self.assertEqual(cursor.prev().data, 10)
+        self.assertEqual(cursor.prev().data, 5)
+        self.assertEqual(cursor.next().data, 10)
+        self.assertEqual(seek_floor(root, 24).node.data, 10)
+        self.assertIsNone(seek_floor(root, 1).node)
+
+        cursor = last(root)  # stepping off either end and back in
+        self.assertIsNone(cursor.next())
+        self.assertIsNone(cursor.next())
+        self.assertEqual(cursor.prev().data, 40)
+        cursor = first(root)
+        self.assertIsNone(cursor.prev())
+        self.assertEqual(cursor.next().data, 2)
+        self.assertEqual(seek_ceil(root, 41).prev().data, 40)
+        self.assertIsNone(seek_ceil(root, 41).next())
+        self.assertEqual(seek_floor(root, 1).next().data, 2)
+        self.assertIsNone(seek_floor(root, 1).prev())
+        self.assertIsNone(first(None).next())
+        self.assertIsNone(last(None).prev())
+
+        root = None
+        for x in range(2000):  # pages through a big tree without building a list
+            root = rb_insert(root, x)
+        page = iter_from(root, 1500)
+        self.assertEqual([next(page) for _ in range(3)], [1500, 1501, 1502])
+        self.assertEqual(sum(1 for _ in iter_range(root, 100, 199)), 100)
+
 
 if __name__ == "__main__":
-    unittest.main()
+    if sys.argv[1:] == ["bench"]:  # python binary-search-tree.py bench
+        bench_balanced()
+    else:
+        unittest.main()
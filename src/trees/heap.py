@@ -1,5 +1,11 @@
+import asyncio
 import unittest
 import math
+import queue
+import random
+import sys
+import threading
+import time
 
 """
 Binary heap
@@ -21,6 +27,12 @@ Left child of node at index i: left(i) = 2i + 1
 right(i) = 2i + 2
 parent(i) = floor((i - 1)/2)
 
+d-ary heap: every node has d children instead of 2, at d*i + 1 ... d*i + d, and
+parent(i) = floor((i - 1)/d). The height drops to log_d(n), so insert and decrease key
+(which only walk up) get cheaper, while extract min compares d children per level on the
+way down, d * log_d(n) comparisons in total. 4 is usually the sweet spot: half the levels
+of a binary heap, and the 4 children of a node sit next to each other in memory.
+
 Array representation has its usual advantages:
     1. Contiguous storage therefore random access
     2. cache friendliness
@@ -49,9 +61,10 @@ Utility functions:
 
 
 class MinHeap:
-    def __init__(self, ls=[]):
+    def __init__(self, ls=None, arity=2):
         """
-        When l is provided, build heap using it.
+        When l is provided, build heap using it (in place, the heap keeps using that list).
+        arity is the number of children of every node (see d-ary heap above).
         Naive approach: Sort the arr and then build heap
         Time complexity: O(n log n)
 
@@ -60,50 +73,80 @@ class MinHeap:
         The assumption for that node is the left and right children are already heapified.
         Last non-leaf node is going to be the parent of last-node.
         i.e. parent of node at (len(l)-1) index
-        i.e. Node at index ((len(l)-1) - 1)//2.
+        i.e. Node at index ((len(l)-1) - 1)//arity.
 
         Time complexity: O(n)
         https://www.geeksforgeeks.org/building-heap-from-array/
         """
-        self.arr = ls
-        i = (len(ls) - 2) // 2
+        if arity < 2:
+            raise ValueError("arity must be at least 2")
+        self.arity = arity
+        self.arr = [] if ls is None else ls
+        self.build()
+
+    def build(self):
+        """Build heap of the whole array, bottom up as explained in the constructor"""
+        i = (len(self.arr) - 2) // self.arity
         while i >= 0:  # carry out heapifying till we reach the root
             self.heapify(i)
             i -= 1
 
     def parent(self, i):
-        return (i - 1) // 2
+        return (i - 1) // self.arity
 
     def lchild(self, i):
-        return (2 * i) + 1
+        return (self.arity * i) + 1  # leftmost child
 
     def rchild(self, i):
-        return (2 * i) + 2
+        return (self.arity * i) + self.arity  # rightmost child
 
     def heapify(self, i):
         """
         Fixes min heap whose root might be violating min heap property
 
         Time complexity: O(log n)
-        Aux space: O(log n)
+        Aux space: O(1)
+
+        Instead of swapping the root with its smaller child level after level (3 writes per
+        level, and a recursive call), the root x is lifted out, leaving a "hole" at i. The smaller
+        child moves up into the hole, which moves the hole one level down, until x is no bigger
+        than the children of the hole and goes there. That's one write per level.
         """
-        arr = self.arr
-        # get the left and right children of i
-        lt = self.lchild(i)
-        rt = self.rchild(i)
-        # we'll assume that i is smallest to begin with and will find which of three: i, left child or right child is smallest
-        smallest = i
+        arr, d = self.arr, self.arity
         n = len(arr)
-        # < n condition makes sure we don't go beyond size of the list in the recursive calls
-        if lt < n and arr[lt] < arr[smallest]:
-            smallest = lt
-        if rt < n and arr[rt] < arr[smallest]:
-            smallest = rt
-        # if root is not smallest, swap and carry on heapifying the concerned subtree
-        # smallest points to root of one of the subtrees, left or right
-        if smallest != i:
-            arr[smallest], arr[i] = arr[i], arr[smallest]
-            self.heapify(smallest)
+        x = arr[i]
+        child = d * i + 1  # left child, inlined instead of calling self.lchild on every level
+        while child < n:
+            if d == 2:
+                # we'll assume that the left child is smallest and check the right one
+                if child + 1 < n and arr[child + 1] < arr[child]:
+                    child += 1
+            else:
+                best = arr[child]
+                for c in range(child + 1, min(child + d, n)):  # smallest of the d children
+                    if arr[c] < best:
+                        child, best = c, arr[c]
+            if not arr[child] < x:  # x fits in the hole
+                break
+            arr[i] = arr[child]  # smallest child moves up, the hole moves down
+            i = child
+            child = d * i + 1
+        arr[i] = x
+
+    def sift_up(self, i):
+        """
+        Moves the key at index i up till its parent is smaller or equal. Same "hole" idea as
+        heapify: the parents move down one level each and the key is written once, at the end.
+        """
+        arr, d = self.arr, self.arity
+        x = arr[i]
+        while i > 0:
+            p = (i - 1) // d
+            if not x < arr[p]:
+                break
+            arr[i] = arr[p]
+            i = p
+        arr[i] = x
 
     def insert(self, x):
         """
@@ -111,19 +154,63 @@ class MinHeap:
 
         The idea is to append x to the end of the array - O(1) operation
         But if it is smaller than its parents, it will violate min heap property.
-        Therefore, we travel the height of the binary heap, and keep swapping x with parent (and grant-parent etc)
-        as needed till it's in its intended place.
+        Therefore, we travel the height of the binary heap, and keep moving the parent (and grant-parent etc)
+        down as needed till x is in its intended place.
         This operation is O(log n) since traveling across the height of binary heap is log of size operation.
         """
+        self.arr.append(x)
+        self.sift_up(len(self.arr) - 1)
+
+    def push_many(self, xs):
+        """
+        Insert all of xs.
+
+        k inserts cost O(k log n), a rebuild of the whole array O(n + k). So small batches
+        are inserted one by one and big ones (compared to the heap) are appended and the
+        heap is rebuilt, whichever needs fewer steps.
+        """
+        xs = list(xs)
+        arr = self.arr
+        n, k = len(arr), len(xs)
+        if k * math.log(n + k + 1, self.arity) < n + k:
+            for x in xs:
+                arr.append(x)
+                self.sift_up(len(arr) - 1)
+        else:
+            arr.extend(xs)
+            self.build()
+
+    def merge(self, other):
+        """
+        Add all the keys of other (any MinHeap, other is left as it is) to this heap.
+        An array heap can't do better than O(n + m): push_many rebuilds the combined array.
+        """
+        self.push_many(other.arr)
+
+    def pushpop(self, x):
+        """
+        Insert x and then extract min, with at most one heapify.
+        If x is smaller than the root it would come right back out, so it's returned as is
+        and the heap isn't touched. Otherwise x takes the place of the root and sinks down.
+        """
+        arr = self.arr
+        if arr and arr[0] < x:
+            x, arr[0] = arr[0], x
+            self.heapify(0)
+        return x
+
+    def heapreplace(self, x):
+        """
+        Extract min and then insert x, with one heapify instead of a heapify and a sift up.
+        Unlike pushpop the returned value is always the old min, even if x is smaller.
+        """
         arr = self.arr
-        arr.append(x)
-        # move it in its right place
-        i = len(arr) - 1  # current index of x
-        # continue swap till we either reach root (i = 0) or parent is smaller or equal (arr[self.parent(i)] > arr[i])
-        while i > 0 and arr[self.parent(i)] > arr[i]:
-            p = self.parent(i)
-            arr[i], arr[p] = arr[p], arr[i]  # swap with parent
-            i = p  # move i to parent and continue
+        if not arr:  # nothing to extract, like extract_min
+            arr.append(x)
+            return math.inf
+        res, arr[0] = arr[0], x
+        self.heapify(0)
+        return res
 
     def extract_min(self):
         """
@@ -142,24 +229,21 @@ class MinHeap:
         if len(arr) == 0:  # deal with empty heap
             return math.inf
         res = arr[0]  # it's the root element of the heap i.e. the smallest element
-        arr[0] = arr[-1]  # assign the last element value to the root element
-        arr.pop()  # remove the last element
-        self.heapify(0)  # heapify again
+        last = arr.pop()  # remove the last element
+        if arr:
+            arr[0] = last  # put the last element value in the root element
+            self.heapify(0)  # heapify again
         return res  # and return the min element
 
     def decrease_key(self, i, x):
         """
         Time complexity: O(log n)
 
-        Replace the key at index i with x and then we swap it with parent
+        Replace the key at index i with x and then we move it above its parent
         (and grant-parent etc) as needed till it's in its intended place.
         """
-        arr = self.arr
-        arr[i] = x  # replace the key at index i with x
-        while i != 0 and arr[self.parent(i)] > arr[i]:  # bubble up
-            p = self.parent(i)
-            arr[p], arr[i] = arr[i], arr[p]
-            i = p
+        self.arr[i] = x  # replace the key at index i with x
+        self.sift_up(i)  # bubble up
 
     def delete(self, i):
         """
@@ -175,6 +259,547 @@ class MinHeap:
             self.extract_min()  # remove the root and re-heapify
 
 
+class IndexedMinHeap:
+    """
+    Min heap of keys with priorities that can find any key in O(1), so decrease_key and
+    remove take the key itself instead of its array index (which changes with every swap).
+    That's what Dijkstra or Prim need: decrease the distance of vertex v.
+
+    The heap array holds the keys, prio maps a key to its priority and pos maps a key to its
+    index in the array. Every key that moves in a sift gets its pos updated.
+
+    Time complexity: push, pop, decrease_key, remove O(log n), contains and peek O(1)
+    """
+
+    def __init__(self, arity=2):
+        if arity < 2:
+            raise ValueError("arity must be at least 2")
+        self.arity = arity  # children per node, like MinHeap
+        self.arr = []  # keys, in heap order of their priorities
+        self.prio = {}  # key -> priority
+        self.pos = {}  # key -> index of key in arr
+
+    def __len__(self):
+        return len(self.arr)
+
+    def __contains__(self, key):
+        return key in self.pos
+
+    def contains(self, key):
+        return key in self.pos
+
+    def peek(self):
+        """(key, priority) with the smallest priority, without removing it"""
+        if not self.arr:
+            raise IndexError("peek from an empty heap")
+        key = self.arr[0]
+        return key, self.prio[key]
+
+    def push(self, key, prio):
+        if key in self.pos:
+            raise KeyError(f"{key!r} is already in the heap")
+        self.arr.append(key)
+        self.prio[key] = prio
+        self.pos[key] = len(self.arr) - 1
+        self._sift_up(len(self.arr) - 1)
+
+    def pop(self):
+        """Remove and return (key, priority) with the smallest priority"""
+        if not self.arr:
+            raise IndexError("pop from an empty heap")
+        key = self.arr[0]
+        self._remove_at(0)
+        return key, self.prio.pop(key)
+
+    def decrease_key(self, key, prio):
+        """Lower the priority of key to prio. A decrease can only move the key up."""
+        if prio > self.prio[key]:
+            raise ValueError(f"new priority {prio!r} is greater than the current one")
+        self.prio[key] = prio
+        self._sift_up(self.pos[key])
+
+    def remove(self, key):
+        """Remove key from anywhere in the heap and return its priority"""
+        self._remove_at(self.pos[key])
+        return self.prio.pop(key)
+
+    def _remove_at(self, i):
+        """Move the last key into slot i and restore the heap property around it"""
+        arr, pos = self.arr, self.pos
+        del pos[arr[i]]
+        last = arr.pop()
+        if i == len(arr):  # removed the last slot, nothing to fix
+            return
+        arr[i] = last
+        pos[last] = i
+        # the last key can be smaller than the parent of i (when i is in another subtree)
+        # or bigger than its new children, only one of the two moves does anything
+        self._sift_up(i)
+        self._sift_down(self.pos[last])
+
+    def _sift_up(self, i):
+        # hole based like MinHeap.sift_up, every key that moves gets its new position
+        arr, prio, pos, d = self.arr, self.prio, self.pos, self.arity
+        key = arr[i]
+        p_key = prio[key]
+        while i > 0:
+            p = (i - 1) // d
+            if not p_key < prio[arr[p]]:
+                break
+            arr[i] = arr[p]
+            pos[arr[i]] = i
+            i = p
+        arr[i] = key
+        pos[key] = i
+
+    def _sift_down(self, i):
+        arr, prio, pos, d = self.arr, self.prio, self.pos, self.arity
+        n = len(arr)
+        key = arr[i]
+        p_key = prio[key]
+        child = d * i + 1
+        while child < n:
+            for c in range(child + 1, min(child + d, n)):  # smallest of the d children
+                if prio[arr[c]] < prio[arr[child]]:
+                    child = c
+            if not prio[arr[child]] < p_key:
+                break
+            arr[i] = arr[child]
+            pos[arr[i]] = i
+            i = child
+            child = d * i + 1
+        arr[i] = key
+        pos[key] = i
+
+
+"""
+Mergeable heaps
+
+Melding two array heaps means rebuilding one array out of both: O(n + m). Heaps made of
+linked trees can meld by linking roots instead.
+
+Pairing heap: a single tree whose root is the min, a node keeps its children in a linked
+list (child = leftmost child, sibling = next one).
+    - insert / meld: link the two roots, the bigger root becomes the leftmost child of the
+      smaller one. O(1)
+    - decrease key: cut the node's subtree out and link it with the root. O(1), amortised
+      O(log n) in theory, but in practice about as fast as the O(1) of Fibonacci heaps.
+    - extract min: remove the root and link its children in two passes, first in pairs
+      from left to right, then the pairs from right to left into one tree. Amortised O(log n)
+
+Binomial heap: a list of binomial trees, at most one of every order k. A tree of order k
+has 2^k nodes and is two trees of order k - 1 linked together, so the trees of a heap of
+n keys are the 1 bits of n.
+    - meld: add the two lists like binary numbers, two trees of order k "carry" a tree of
+      order k + 1. O(log n)
+    - insert: meld with a heap of one tree of order 0. Amortised O(1), like incrementing a
+      binary counter.
+    - extract min: the min is one of the O(log n) roots, its children are trees of order
+      0 .. k - 1 which are melded back. O(log n)
+    - decrease key: bubble the key up like a binary heap does. O(log n)
+
+Both return a handle from insert, which decrease_key and delete take (like IndexedMinHeap
+takes a key, the position of a node changes as the heap changes).
+"""
+
+
+class PairingNode:
+    def __init__(self, key):
+        self.key = key
+        self.child = None  # leftmost child
+        self.sibling = None  # next sibling to the right
+        self.prev = None  # left sibling, or parent for the leftmost child
+
+
+class PairingHeap:
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, x):
+        """Add x and return its node, the handle for decrease_key and delete"""
+        node = PairingNode(x)
+        self.root = self._link(self.root, node)
+        self.size += 1
+        return node
+
+    def meld(self, other):
+        """Move all the keys of other into this heap, O(1). other is left empty."""
+        self.root = self._link(self.root, other.root)
+        self.size += other.size
+        other.root, other.size = None, 0
+
+    def extract_min(self):
+        root = self.root
+        if root is None:  # deal with empty heap, like MinHeap
+            return math.inf
+        # first pass: link the children in pairs, from left to right
+        pairs = []
+        c = root.child
+        while c is not None:
+            a, b = c, c.sibling
+            c = b.sibling if b is not None else None
+            a.sibling = a.prev = None
+            if b is not None:
+                b.sibling = b.prev = None
+            pairs.append(self._link(a, b))
+        # second pass: link the pairs into one tree, from right to left
+        new_root = pairs.pop() if pairs else None
+        while pairs:
+            new_root = self._link(pairs.pop(), new_root)
+        self.root = new_root
+        self.size -= 1
+        return root.key
+
+    def decrease_key(self, node, x):
+        """
+        Time complexity: O(1)
+
+        Lower the key of node to x. If it's now smaller than its parent, its subtree is cut
+        out (all of it is still heap ordered) and linked with the root.
+        """
+        if x > node.key:
+            raise ValueError(f"new key {x!r} is greater than the current one")
+        node.key = x
+        if node is self.root:
+            return
+        if node.prev.child is node:  # leftmost child
+            node.prev.child = node.sibling
+        else:
+            node.prev.sibling = node.sibling
+        if node.sibling is not None:
+            node.sibling.prev = node.prev
+        node.sibling = node.prev = None
+        self.root = self._link(self.root, node)
+
+    def delete(self, node):
+        """Same as MinHeap.delete: make node the min, then extract it"""
+        self.decrease_key(node, -math.inf)
+        self.extract_min()
+
+    def _link(self, a, b):
+        """Root of the tree made by linking roots a and b (either can be None)"""
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if b.key < a.key:
+            a, b = b, a
+        b.prev, b.sibling = a, a.child  # b becomes the leftmost child of a
+        if a.child is not None:
+            a.child.prev = b
+        a.child = b
+        return a
+
+
+class BinomialEntry:
+    """Handle to a key of a BinomialHeap. Keys move between nodes, so node is kept up to date."""
+
+    def __init__(self, key):
+        self.key = key
+        self.node = None
+
+
+class BinomialNode:
+    def __init__(self, entry):
+        self.entry = entry
+        self.parent = None
+        self.children = []  # children[i] is the root of a tree of order i
+
+
+class BinomialHeap:
+    def __init__(self):
+        self.trees = []  # trees[k] is the root of the tree of order k, or None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, x):
+        """Add x and return its entry, the handle for decrease_key and delete"""
+        entry = BinomialEntry(x)
+        entry.node = BinomialNode(entry)
+        self._add_tree(entry.node, 0)
+        self.size += 1
+        return entry
+
+    def meld(self, other):
+        """Move all the keys of other into this heap, O(log n). other is left empty."""
+        for k, tree in enumerate(other.trees):
+            if tree is not None:
+                self._add_tree(tree, k)
+        self.size += other.size
+        other.trees, other.size = [], 0
+
+    def extract_min(self):
+        if self.size == 0:
+            return math.inf
+        k = min((k for k, t in enumerate(self.trees) if t is not None), key=lambda k: self.trees[k].entry.key)
+        root = self.trees[k]
+        self.trees[k] = None
+        while self.trees and self.trees[-1] is None:
+            self.trees.pop()
+        for order, child in enumerate(root.children):  # meld the children back
+            child.parent = None
+            self._add_tree(child, order)
+        self.size -= 1
+        return root.entry.key
+
+    def decrease_key(self, entry, x):
+        """
+        Time complexity: O(log n)
+
+        Lower the key of entry to x and swap it with the key of its parent as long as it's
+        smaller, like MinHeap.sift_up. The entries move along with the keys.
+        """
+        if x > entry.key:
+            raise ValueError(f"new key {x!r} is greater than the current one")
+        entry.key = x
+        node = entry.node
+        while node.parent is not None and x < node.parent.entry.key:
+            parent = node.parent
+            node.entry, parent.entry = parent.entry, node.entry
+            node.entry.node, parent.entry.node = node, parent
+            node = parent
+
+    def delete(self, entry):
+        self.decrease_key(entry, -math.inf)
+        self.extract_min()
+
+    def _add_tree(self, tree, k):
+        """Add a tree of order k, carrying like a binary addition"""
+        trees = self.trees
+        while k < len(trees) and trees[k] is not None:
+            other = trees[k]
+            trees[k] = None
+            if other.entry.key < tree.entry.key:
+                tree, other = other, tree
+            other.parent = tree  # link: the bigger root becomes the child of order k
+            tree.children.append(other)
+            k += 1
+        if k >= len(trees):
+            trees.extend([None] * (k + 1 - len(trees)))
+        trees[k] = tree
+
+
+"""
+Streaming with a heap
+
+k-way merge: the smallest remaining item of k sorted inputs is the smallest of their
+heads. A heap of the k heads gives it in O(log k): yield the root, replace it with the
+next item of the same input and heapify. n items cost O(n log k) time and O(k) memory,
+whatever the length of the inputs, so they can be (lazy) files or generators.
+
+Top k: keep the k largest items seen so far in a min heap. Its root is the smallest of
+them, the one a bigger new item replaces. O(n log k) time, O(k) memory. For the k smallest
+the heap is a max heap, a MinHeap of Reversed items.
+"""
+
+
+class Reversed:
+    """Wraps a value so that it compares the other way round: a MinHeap of them is a max heap"""
+
+    __slots__ = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+
+    def __lt__(self, other):
+        return other.val < self.val
+
+
+def k_way_merge(*iterables, key=None):
+    """
+    Merge sorted iterables into one sorted stream, lazily. key works like in sorted(), and
+    items that compare equal come out in the order of their iterables (the merge is stable).
+    """
+    heap = MinHeap()
+    for i, it in enumerate(map(iter, iterables)):
+        for x in it:  # the first item, if there is one
+            heap.insert((x if key is None else key(x), i, x, it))
+            break
+    arr = heap.arr
+    while arr:
+        _, i, x, it = arr[0]  # i breaks ties, so items and iterators are never compared
+        yield x
+        for nxt in it:
+            heap.heapreplace((nxt if key is None else key(nxt), i, nxt, it))
+            break
+        else:  # this input is exhausted
+            heap.extract_min()
+
+
+def top_k(iterable, k, key=None):
+    """The k largest items of iterable, largest first. Ties go to the earliest items."""
+    if k <= 0:
+        return []
+    heap = MinHeap()
+    arr = heap.arr
+    for i, x in enumerate(iterable):
+        entry = (x if key is None else key(x), -i, x)  # -i: of two equal keys the later is smaller
+        if len(arr) < k:
+            heap.insert(entry)
+        elif arr[0] < entry:
+            heap.heapreplace(entry)
+    return [x for _, _, x in sorted(arr, reverse=True)]
+
+
+def bottom_k(iterable, k, key=None):
+    """The k smallest items of iterable, smallest first. Ties go to the earliest items."""
+    if k <= 0:
+        return []
+    heap = MinHeap()
+    arr = heap.arr
+    for i, x in enumerate(iterable):
+        entry = (x if key is None else key(x), i, x)
+        if len(arr) < k:
+            heap.insert(Reversed(entry))
+        elif entry < arr[0].val:  # smaller than the largest of the k kept so far
+            heap.heapreplace(Reversed(entry))
+    return [x for _, _, x in sorted(e.val for e in arr)]
+
+
+"""
+Priority queues for threads and asyncio tasks
+
+Both queues keep two MinHeaps: the ready items by (priority, sequence number) and the
+delayed ones by (ready time, sequence number). Every get first moves the due delayed items
+over to the ready heap, so a delayed item costs O(log n) twice and nothing while it waits.
+When nothing is ready, a getter sleeps until the next delayed item is due (or a put wakes
+it up). The sequence number keeps equal priorities first in, first out.
+
+maxsize bounds the number of items, delayed ones included: a put waits for a get to make
+room (back-pressure on the producers). 0 means unbounded.
+"""
+
+
+class TimedHeap:
+    """The two heaps shared by the queues below, without any locking"""
+
+    def __init__(self, clock=time.monotonic):
+        self.ready = MinHeap()  # (priority, seq, item)
+        self.delayed = MinHeap()  # (ready time, seq, priority, item)
+        self.clock = clock
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.ready.arr) + len(self.delayed.arr)
+
+    def push(self, item, prio, delay=0):
+        self.seq += 1
+        if delay > 0:
+            self.delayed.insert((self.clock() + delay, self.seq, prio, item))
+        else:
+            self.ready.insert((prio, self.seq, item))
+
+    def pop_ready(self, n):
+        """Up to n ready items, highest priority (smallest value) first"""
+        delayed, now = self.delayed.arr, self.clock()
+        while delayed and delayed[0][0] <= now:  # move the due items over
+            _, seq, prio, item = self.delayed.extract_min()
+            self.ready.insert((prio, seq, item))
+        res = []
+        while self.ready.arr and len(res) < n:
+            res.append(self.ready.extract_min()[2])
+        return res
+
+    def wait_time(self):
+        """Seconds until the next delayed item is due, None if there is none"""
+        return max(0.0, self.delayed.arr[0][0] - self.clock()) if self.delayed.arr else None
+
+
+class BlockingPriorityQueue:
+    """
+    Thread-safe priority queue. get blocks until an item is ready and put blocks while the
+    queue is full, both up to timeout seconds (None waits for ever) after which they raise
+    queue.Empty / queue.Full like the standard library queues.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.heaps = TimedHeap()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.heaps)
+
+    def put(self, item, prio, delay=0, timeout=None):
+        """Add item with priority prio, ready for get only after delay seconds"""
+        with self.not_full:
+            if not self.not_full.wait_for(lambda: not self.maxsize or len(self.heaps) < self.maxsize, timeout):
+                raise queue.Full
+            self.heaps.push(item, prio, delay)
+            self.not_empty.notify()  # a getter may be waiting for this, or for a later delayed item
+
+    def get(self, timeout=None):
+        return self.get_many(1, timeout)[0]
+
+    def get_many(self, n, timeout=None):
+        """Wait until at least one item is ready, then take up to n ready items at once"""
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.not_empty:
+            while True:
+                items = self.heaps.pop_ready(n)
+                if items:
+                    self.not_full.notify(len(items))
+                    return items
+                wait = self.heaps.wait_time()
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise queue.Empty
+                    wait = left if wait is None else min(wait, left)
+                self.not_empty.wait(wait)
+
+
+class AsyncPriorityQueue:
+    """
+    asyncio version of BlockingPriorityQueue, for tasks of one event loop. Waiting doesn't
+    block the loop; use asyncio.wait_for(queue.get(), timeout) for a timeout.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.heaps = TimedHeap()
+        lock = asyncio.Lock()
+        self.not_empty = asyncio.Condition(lock)
+        self.not_full = asyncio.Condition(lock)
+
+    def __len__(self):
+        return len(self.heaps)
+
+    async def put(self, item, prio, delay=0):
+        async with self.not_full:
+            await self.not_full.wait_for(lambda: not self.maxsize or len(self.heaps) < self.maxsize)
+            self.heaps.push(item, prio, delay)
+            self.not_empty.notify()
+
+    async def get(self):
+        return (await self.get_many(1))[0]
+
+    async def get_many(self, n):
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        async with self.not_empty:
+            while True:
+                items = self.heaps.pop_ready(n)
+                if items:
+                    self.not_full.notify(len(items))
+                    return items
+                try:  # sleep until the next delayed item is due, or a put comes in
+                    await asyncio.wait_for(self.not_empty.wait(), self.heaps.wait_time())
+                except asyncio.TimeoutError:
+                    pass
+
+
 """
 Heap Sort
     Can be seen as optimization over selection sort.
@@ -189,7 +814,7 @@ Steps:
     2. Repeatedly swap root with the last node, reduce heap size by 1 and heapify
 
 Time complexity: O(n log n)
-Aux space: O(1) (or O(log n) if we use recursion)
+Aux space: O(1) (max_heapify is iterative, see MinHeap.heapify for the "hole" idea)
 
 It's not stable.
 Heapsort is 2-3 times slower than quicksort because quicksort has better locality of reference than heapsort.
@@ -204,16 +829,17 @@ def build_heap(arr):
 
 
 def max_heapify(arr, n, i):
-    largest = i
-    left = 2 * i + 1
-    right = 2 * i + 2
-    if left < n and arr[left] > arr[largest]:
-        largest = left
-    if right < n and arr[right] > arr[largest]:
-        largest = right
-    if largest != i:
-        arr[i], arr[largest] = arr[largest], arr[i]
-        max_heapify(arr, n, largest)  # max_heapify the subtree with largest as its root
+    x = arr[i]
+    child = 2 * i + 1
+    while child < n:
+        if child + 1 < n and arr[child + 1] > arr[child]:
+            child += 1  # largest of the two children
+        if not arr[child] > x:
+            break
+        arr[i] = arr[child]  # move the largest child up and carry on in its subtree
+        i = child
+        child = 2 * i + 1
+    arr[i] = x
 
 
 def heap_sort(arr):
@@ -226,11 +852,281 @@ def heap_sort(arr):
         max_heapify(arr, i, 0)
 
 
+def timed(f, *args):
+    """seconds taken by f(*args)"""
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def bench_heap(sizes=(10**6,)):
+    """
+    Time of building a MinHeap, extracting 10% of it and heap sorting n random floats, for the
+    iterative hole-based sifts against the recursive swap-based ones they replaced.
+    python heap.py bench 1000000 10000000 (10^7 takes a few minutes).
+    """
+
+    class RecursiveMinHeap(MinHeap):
+        def heapify(self, i):
+            arr = self.arr
+            lt, rt = self.lchild(i), self.rchild(i)
+            smallest = i
+            n = len(arr)
+            if lt < n and arr[lt] < arr[smallest]:
+                smallest = lt
+            if rt < n and arr[rt] < arr[smallest]:
+                smallest = rt
+            if smallest != i:
+                arr[smallest], arr[i] = arr[i], arr[smallest]
+                self.heapify(smallest)
+
+    def recursive_max_heapify(arr, n, i):
+        largest, left, right = i, 2 * i + 1, 2 * i + 2
+        if left < n and arr[left] > arr[largest]:
+            largest = left
+        if right < n and arr[right] > arr[largest]:
+            largest = right
+        if largest != i:
+            arr[i], arr[largest] = arr[largest], arr[i]
+            recursive_max_heapify(arr, n, largest)
+
+    def recursive_heap_sort(arr):
+        n = len(arr)
+        for i in range((n - 2) // 2, -1, -1):
+            recursive_max_heapify(arr, n, i)
+        for i in range(n - 1, 0, -1):
+            arr[i], arr[0] = arr[0], arr[i]
+            recursive_max_heapify(arr, i, 0)
+
+    def build_and_extract(cls, data):
+        heap = cls(data)
+        for _ in range(len(data) // 10):
+            heap.extract_min()
+
+    for n in sizes:
+        data = [random.random() for _ in range(n)]
+        for name, f, g in [
+            ("build + extract 10%", lambda d: build_and_extract(RecursiveMinHeap, d), lambda d: build_and_extract(MinHeap, d)),
+            ("heap_sort", recursive_heap_sort, heap_sort),
+        ]:
+            before, after = timed(f, data[:]), timed(g, data[:])
+            print(f"n={n:>9} {name:<20} recursive {before:7.2f}s  iterative {after:7.2f}s  x{before / after:.2f}")
+
+
+def bench_arity(sizes=(10**6,), arities=(2, 4, 8)):
+    """
+    MinHeap with d = 2, 4 and 8 children per node on
+        - push heavy: n inserts of random keys
+        - pop heavy: build from n keys, then extract them all
+        - mixed: n rounds of insert, decrease_key of a random slot and every other round extract_min
+    """
+
+    def push_heavy(heap, data):
+        insert = heap.insert
+        for x in data:
+            insert(x)
+
+    def pop_heavy(heap, data):
+        heap.__init__(data[:], heap.arity)
+        for _ in range(len(data)):
+            heap.extract_min()
+
+    def mixed(heap, data):
+        rng = random.Random(0)
+        for k, x in enumerate(data):
+            heap.insert(x)
+            i = rng.randrange(len(heap.arr))
+            heap.decrease_key(i, heap.arr[i] - rng.random())
+            if k % 2:
+                heap.extract_min()
+
+    for n in sizes:
+        data = [random.random() for _ in range(n)]
+        for name, workload in [("push heavy", push_heavy), ("pop heavy", pop_heavy), ("mixed", mixed)]:
+            times = [timed(workload, MinHeap(arity=d), data) for d in arities]
+            print(f"n={n:>9} {name:<11} " + "  ".join(f"d={d} {t:6.2f}s" for d, t in zip(arities, times)))
+
+
+def bench_mergeable(n=200_000, workers=8):
+    """
+    Array heap (MinHeap) against PairingHeap and BinomialHeap on a scheduler-like run:
+    workers heaps of n / workers random keys are melded into one, n / 4 keys are decreased,
+    then everything is extracted. MinHeap decreases keys at random indices (it has no handles)
+    and merges with push_many.
+    """
+
+    def meld_all(meld, heaps):
+        for heap in heaps:
+            meld(heap)
+
+    def decrease_at(heap, picks):  # MinHeap, picks are indices
+        for i in picks:
+            heap.decrease_key(i, heap.arr[i] - 1)
+
+    def decrease_handles(heap, picks):
+        for node in picks:
+            heap.decrease_key(node, node.key - 1)
+
+    def extract_all(heap, size):
+        for _ in range(size):
+            heap.extract_min()
+
+    rng = random.Random(0)
+    parts = [[rng.random() for _ in range(n // workers)] for _ in range(workers)]
+    for cls in (MinHeap, PairingHeap, BinomialHeap):
+        heaps, handles = [], []
+        for part in parts:
+            heap = cls()
+            if cls is MinHeap:
+                heap.push_many(part)
+            else:
+                handles.extend(heap.insert(x) for x in part)
+            heaps.append(heap)
+        first = heaps[0]
+        meld = first.merge if cls is MinHeap else first.meld
+        t_meld = timed(meld_all, meld, heaps[1:])
+        size = len(first.arr) if cls is MinHeap else len(first)
+        if cls is MinHeap:
+            picks = [rng.randrange(size) for _ in range(n // 4)]
+            t_dec = timed(decrease_at, first, picks)
+        else:
+            picks = rng.sample(handles, n // 4)
+            t_dec = timed(decrease_handles, first, picks)
+        t_ext = timed(extract_all, first, size)
+        print(f"{cls.__name__:<13} meld {t_meld:6.3f}s  decrease_key {t_dec:6.3f}s  extract_min {t_ext:6.3f}s")
+
+
 class HeapTests(unittest.TestCase):
     def test_create_heap(self):
         heap = MinHeap([10, 5, 20, 2, 4, 8])
         self.assertListEqual(heap.arr, [2, 4, 8, 5, 10, 20])
 
+    def test_indexed_heap(self):
+        heap = IndexedMinHeap()
+        for key, prio in [("a", 7), ("b", 3), ("c", 9), ("d", 5), ("e", 8)]:
+            heap.push(key, prio)
+        self.assertTrue(heap.contains("c"))
+        heap.decrease_key("c", 1)
+        self.assertEqual(heap.peek(), ("c", 1))
+        self.assertEqual(heap.remove("d"), 5)
+        self.assertNotIn("d", heap)
+        self.assertRaises(ValueError, heap.decrease_key, "a", 10)
+        self.assertRaises(KeyError, heap.push, "a", 1)
+        self.assertEqual([heap.pop() for _ in range(len(heap))], [("c", 1), ("b", 3), ("a", 7), ("e", 8)])
+        self.assertRaises(IndexError, heap.pop)
+
+    def test_heap_operations(self):
+        data = random.Random(1).sample(range(10000), 3000)
+        for arity in (2, 3, 4, 8):
+            heap = MinHeap(data[:], arity=arity)
+            for x in range(-50, 0):
+                heap.insert(x)
+            heap.decrease_key(len(heap.arr) - 1, -100)
+            heap.delete(5)
+            out = [heap.extract_min() for _ in range(len(heap.arr))]
+            self.assertEqual(out, sorted(out))
+            self.assertEqual(len(out), 3049)
+            self.assertEqual(out[0], -100)
+            self.assertEqual(heap.extract_min(), math.inf)
+        self.assertRaises(ValueError, MinHeap, [], arity=1)
+
+        arr = data[:]
+        heap_sort(arr)
+        self.assertEqual(arr, sorted(data))
+
+    def test_bulk_operations(self):
+        data = random.Random(2).sample(range(10000), 2000)
+        for batch in (data[1000:1010], data[1000:]):  # one by one, then a rebuild
+            heap = MinHeap(data[:1000], arity=3)
+            heap.push_many(batch)
+            heap.merge(MinHeap([-1, -2]))
+            out = [heap.extract_min() for _ in range(len(heap.arr))]
+            self.assertEqual(out, sorted(data[:1000] + batch + [-1, -2]))
+
+        heap = MinHeap([5, 3, 8])
+        self.assertEqual(heap.pushpop(1), 1)  # smaller than the min, comes right back
+        self.assertEqual(heap.pushpop(4), 3)
+        self.assertEqual(heap.heapreplace(1), 4)  # old min even though 1 is smaller
+        self.assertEqual([heap.extract_min() for _ in range(3)], [1, 5, 8])
+        self.assertEqual(heap.heapreplace(7), math.inf)
+        self.assertEqual(heap.arr, [7])
+
+    def test_mergeable_heaps(self):
+        rng = random.Random(3)
+        for cls in (PairingHeap, BinomialHeap):
+            a, b = cls(), cls()
+            keys_a, keys_b = rng.sample(range(1000), 300), rng.sample(range(1000, 2000), 300)
+            handles = [a.insert(x) for x in keys_a] + [b.insert(x) for x in keys_b]
+            a.meld(b)
+            self.assertEqual((len(a), len(b)), (600, 0))
+            a.decrease_key(handles[400], -5)  # a key that came from b
+            a.delete(handles[10])
+            self.assertRaises(ValueError, a.decrease_key, handles[20], 5000)
+            expected = sorted(keys_a[:10] + keys_a[11:] + keys_b[:100] + [-5] + keys_b[101:])
+            self.assertEqual([a.extract_min() for _ in range(len(a))], expected)
+            self.assertEqual(a.extract_min(), math.inf)
+
+    def test_streaming(self):
+        rng = random.Random(4)
+        shards = [sorted(rng.randrange(100) for _ in range(rng.randrange(50))) for _ in range(20)]
+        merged = k_way_merge(*(iter(shard) for shard in shards), [])
+        self.assertEqual(list(merged), sorted(x for shard in shards for x in shard))
+        words = k_way_merge(["b", "cc"], ["a", "bb", "ddd"], key=len)
+        self.assertEqual(list(words), ["b", "a", "cc", "bb", "ddd"])  # stable for equal keys
+
+        stream = (rng.randrange(10**6) for _ in range(10000))
+        data = list(stream)
+        self.assertEqual(top_k(iter(data), 10), sorted(data, reverse=True)[:10])
+        self.assertEqual(bottom_k(iter(data), 10), sorted(data)[:10])
+        self.assertEqual(bottom_k(["bb", "a", "cc", "d"], 3, key=len), ["a", "d", "bb"])
+        self.assertEqual(top_k(["bb", "a", "cc", "d"], 1, key=len), ["bb"])
+        self.assertEqual(top_k(data, 0), [])
+
+    def test_blocking_priority_queue(self):
+        pq = BlockingPriorityQueue(maxsize=3)
+        pq.put("later", 0, delay=0.05)
+        pq.put("low", 5)
+        pq.put("high", 1)
+        self.assertRaises(queue.Full, pq.put, "full", 0, timeout=0.01)
+        self.assertEqual(pq.get_many(5), ["high", "low"])  # "later" isn't ready yet
+        with self.assertRaises(ValueError):
+            pq.get_many(0)
+        self.assertEqual(pq.get(timeout=1), "later")  # waits for it
+        self.assertRaises(queue.Empty, pq.get, timeout=0.01)
+
+        results = []
+        consumer = threading.Thread(target=lambda: results.extend(pq.get(timeout=5) for _ in range(50)))
+        consumer.start()
+        for i in range(50):  # more than maxsize, the producer waits for the consumer
+            pq.put(i, i, timeout=5)
+        consumer.join()
+        self.assertEqual(sorted(results), list(range(50)))
+
+    def test_async_priority_queue(self):
+        async def run():
+            pq = AsyncPriorityQueue(maxsize=2)
+            await pq.put("later", 0, delay=0.05)
+            await pq.put("now", 9)
+            blocked = asyncio.create_task(pq.put("third", 1))
+            await asyncio.sleep(0)
+            self.assertFalse(blocked.done())  # full, waits for a get
+            self.assertEqual(await pq.get(), "now")
+            await blocked
+            self.assertEqual(await pq.get_many(5), ["third"])
+            with self.assertRaises(ValueError):
+                await pq.get_many(0)
+            self.assertEqual(await asyncio.wait_for(pq.get(), 1), "later")
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(pq.get(), 0.01)
+
+        asyncio.run(run())
+
 
 if __name__ == "__main__":
-    unittest.main()
+    if sys.argv[1:2] == ["bench"]:  # python heap.py bench [sizes...]
+        sizes = tuple(map(int, sys.argv[2:])) or (10**6,)
+        bench_heap(sizes)
+        bench_arity(sizes)
+        bench_mergeable()
+    else:
+        unittest.main()